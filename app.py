@@ -1,24 +1,37 @@
 import os
 import sys
 import json
-from flask import Flask, render_template, request, jsonify, Response, stream_with_context, send_file, after_this_request
+import mimetypes
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context, send_file
 from flask_cors import CORS
+from werkzeug.wsgi import FileWrapper, _RangeWrapper
 import yt_dlp
+from yt_dlp.postprocessor import FFmpegExtractAudioPP
 import threading
 import queue
 import time
 import logging
 import tempfile
 import shutil
+import subprocess
+import copy
 from datetime import datetime
 import zipfile
 import sqlite3
 from enum import Enum
-from collections import deque
+from collections import deque, OrderedDict
+import heapq
+import hashlib
+import itertools
 import uuid
+from urllib.parse import urlsplit, parse_qs, quote
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
 
 app = Flask(__name__)
 CORS(app)
+# Behind Apache or lighttpd, let the front server send files itself
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE') == '1'
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -32,6 +45,10 @@ class DownloadStatus(Enum):
     FAILED = "failed"
     CANCELLED = "cancelled"
 
+class DownloadPaused(Exception):
+    """Raised when a download stops because it was paused, keeping its partial files"""
+    pass
+
 # Initialize database
 def init_db():
     conn = sqlite3.connect('downloads.db')
@@ -52,33 +69,355 @@ def init_db():
         )
     ''')
     
-    # Add expires_at column if it doesn't exist (for migration)
-    try:
-        conn.execute('ALTER TABLE download_history ADD COLUMN expires_at DATETIME')
-    except:
-        pass  # Column already exists
+    # Add columns that didn't exist in older databases (for migration)
+    for column in ('expires_at DATETIME', 'playlist_limit INTEGER', 'priority INTEGER DEFAULT 0', 'parallelism INTEGER',
+                   'profile TEXT'):
+        try:
+            conn.execute(f'ALTER TABLE download_history ADD COLUMN {column}')
+        except:
+            pass  # Column already exists
     conn.close()
 
 # Initialize database on startup
 init_db()
 
+# Pending jobs ordered by priority, indexed by download id
+class PendingQueue:
+    """Heap of pending downloads with lazy deletion.
+    
+    Higher priority runs first, FIFO within a priority. Cancelling or
+    reprioritizing only invalidates the old heap entry, so every operation
+    is O(log n) and stale entries are skipped when popped.
+    """
+    
+    def __init__(self):
+        self._heap = []
+        self._entries = {}   # download_id -> live heap entry
+        self._items = {}     # download_id -> item, pending and paused
+        self._seq = itertools.count()
+        self._front_seq = itertools.count(-1, -1)
+    
+    def __len__(self):
+        return len(self._items)
+    
+    def __contains__(self, download_id):
+        return download_id in self._items
+    
+    def get(self, download_id):
+        return self._items.get(download_id)
+    
+    def push(self, item, priority=0, seq=None):
+        """Add or requeue an item as dispatchable"""
+        download_id = item['id']
+        self._invalidate(download_id)
+        if seq is None:
+            seq = next(self._seq)
+        item['priority'] = priority
+        entry = [-priority, seq, download_id, True]
+        self._entries[download_id] = entry
+        self._items[download_id] = item
+        heapq.heappush(self._heap, entry)
+    
+    def park(self, item):
+        """Keep an item listed without making it dispatchable (paused)"""
+        self._invalidate(item['id'])
+        self._items[item['id']] = item
+    
+    def remove(self, download_id):
+        """Drop an item; returns it or None"""
+        self._invalidate(download_id)
+        return self._items.pop(download_id, None)
+    
+    def reprioritize(self, download_id, priority):
+        """Change priority keeping the item's place among equal priorities"""
+        entry = self._entries.get(download_id)
+        if entry is None:
+            if download_id in self._items:
+                # Paused items remember the priority for when they resume
+                self._items[download_id]['priority'] = priority
+                return True
+            return False
+        self.push(self._items[download_id], priority, seq=entry[1])
+        return True
+    
+    def move_to_front(self, download_id):
+        """Make a dispatchable item the next one to dispatch; paused items stay parked"""
+        item = self._items.get(download_id)
+        if item is None or download_id not in self._entries or item.get('status') != DownloadStatus.PENDING.value:
+            return False
+        top = self.peek()
+        priority = item.get('priority', 0)
+        if top is not None and top is not item:
+            priority = max(priority, top.get('priority', 0))
+        self.push(item, priority, seq=next(self._front_seq))
+        return True
+    
+    def peek(self):
+        self._drop_stale()
+        return self._items[self._heap[0][2]] if self._heap else None
+    
+    def pop(self):
+        """Remove and return the next dispatchable item, or None"""
+        self._drop_stale()
+        if not self._heap:
+            return None
+        entry = heapq.heappop(self._heap)
+        del self._entries[entry[2]]
+        return self._items.pop(entry[2])
+    
+    def ordered(self):
+        """Items in dispatch order, paused items first"""
+        paused = [item for download_id, item in self._items.items() if download_id not in self._entries]
+        live = sorted(self._entries.values())
+        return paused + [self._items[entry[2]] for entry in live]
+    
+    def _invalidate(self, download_id):
+        entry = self._entries.pop(download_id, None)
+        if entry is not None:
+            entry[3] = False
+            # Rebuild once stale entries dominate so the heap doesn't grow unbounded
+            if len(self._heap) > 64 and len(self._heap) > 2 * len(self._entries):
+                self._heap = [e for e in self._heap if e[3]]
+                heapq.heapify(self._heap)
+    
+    def _drop_stale(self):
+        while self._heap and not self._heap[0][3]:
+            heapq.heappop(self._heap)
+
+# Progress events are fanned out to every subscriber of a download
+PROGRESS_BUFFER_SIZE = 64     # Queued events per subscriber before ticks are dropped
+PROGRESS_REPLAY_SIZE = 5000   # Events kept per download for Last-Event-ID replay
+TERMINAL_STATUSES = ('completed', 'error', 'cancelled', 'playlist_completed')
+
+def is_droppable_event(progress_data):
+    """Intermediate progress ticks may be skipped; state changes may not"""
+    return progress_data.get('status') == 'downloading' or progress_data.get('type') == 'progress'
+
+def is_terminal_event(progress_data):
+    """Events that end a download's stream (a failed playlist entry doesn't)"""
+    return (progress_data.get('status') in TERMINAL_STATUSES
+            and not (progress_data['status'] == 'error' and 'playlist_index' in progress_data))
+
+class ProgressSubscriber:
+    """Bounded buffer of events for one stream consumer"""
+    
+    def __init__(self, maxlen=PROGRESS_BUFFER_SIZE):
+        self.cond = threading.Condition()
+        self.buffer = deque()
+        self.maxlen = maxlen
+        self.dropped = 0
+    
+    def push(self, event):
+        with self.cond:
+            if len(self.buffer) >= self.maxlen and is_droppable_event(event[1]):
+                # Slow consumer: drop the oldest tick, or this one if only state changes are queued
+                for i, (seq, progress_data) in enumerate(self.buffer):
+                    if is_droppable_event(progress_data):
+                        del self.buffer[i]
+                        break
+                else:
+                    self.dropped += 1
+                    return
+                self.dropped += 1
+            self.buffer.append(event)
+            self.cond.notify()
+    
+    def get(self, timeout=None):
+        """Next (seq, event) pair, or None if nothing arrived within timeout"""
+        with self.cond:
+            if not self.buffer:
+                self.cond.wait(timeout)
+            return self.buffer.popleft() if self.buffer else None
+
+class ProgressChannel:
+    """Sequenced progress events of one download"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.log = deque(maxlen=PROGRESS_REPLAY_SIZE)
+        self.subscribers = set()
+    
+    def publish(self, progress_data):
+        with self.lock:
+            self.seq += 1
+            event = (self.seq, progress_data)
+            # Only the latest tick of a download since the last state change is worth replaying
+            if (self.log and is_droppable_event(progress_data) and is_droppable_event(self.log[-1][1])
+                    and self.log[-1][1].get('id') == progress_data.get('id')):
+                self.log[-1] = event
+            else:
+                self.log.append(event)
+            for subscriber in self.subscribers:
+                subscriber.push(event)
+            return self.seq
+    
+    def subscribe(self, last_event_id=0):
+        """New subscriber, primed with every kept event after last_event_id"""
+        with self.lock:
+            return self._subscribe(last_event_id)
+    
+    def resume(self, last_event_id):
+        """Subscriber primed with the events after last_event_id, or None if some of them were dropped"""
+        with self.lock:
+            oldest = self.log[0][0] if self.log else self.seq + 1
+            if 0 < last_event_id <= self.seq and oldest <= last_event_id + 1:
+                return self._subscribe(last_event_id)
+            return None
+    
+    def subscribe_latest(self):
+        """(seq, subscriber) for a client that starts from the current state"""
+        with self.lock:
+            return self.seq, self._subscribe(self.seq)
+    
+    def _subscribe(self, last_event_id):
+        subscriber = ProgressSubscriber()
+        for event in self.log:
+            if event[0] > last_event_id:
+                subscriber.push(event)
+        self.subscribers.add(subscriber)
+        return subscriber
+    
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+class ProgressBus:
+    """Progress channels by download id"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.channels = {}
+    
+    def __contains__(self, download_id):
+        return download_id in self.channels
+    
+    def channel(self, download_id):
+        """Get or create the channel for a download"""
+        with self.lock:
+            channel = self.channels.get(download_id)
+            if channel is None:
+                channel = self.channels[download_id] = ProgressChannel()
+            return channel
+    
+    def publish(self, download_id, progress_data):
+        return self.channel(download_id).publish(progress_data)
+    
+    def remove(self, download_id):
+        with self.lock:
+            self.channels.pop(download_id, None)
+
+class PoolMeter:
+    """Queue depth and utilization of a fixed number of workers"""
+    
+    def __init__(self, workers):
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        # Worker-seconds spent busy, accounted up to changed_at
+        self.busy_seconds = 0.0
+        self.started_at = self.changed_at = time.monotonic()
+    
+    def _account(self):
+        now = time.monotonic()
+        self.busy_seconds += self.active * (now - self.changed_at)
+        self.changed_at = now
+        return now
+    
+    def enqueue(self):
+        with self.lock:
+            self.queued += 1
+    
+    def begin(self, queued=True):
+        with self.lock:
+            self._account()
+            if queued:
+                self.queued -= 1
+            self.active += 1
+    
+    def end(self):
+        with self.lock:
+            self._account()
+            self.active -= 1
+            self.completed += 1
+    
+    def stats(self, queued=None):
+        with self.lock:
+            elapsed = self._account() - self.started_at
+            return {
+                'workers': self.workers,
+                'active': self.active,
+                'queued': self.queued if queued is None else queued,
+                'completed': self.completed,
+                # Share of worker time spent busy since startup
+                'utilization': round(self.busy_seconds / (self.workers * elapsed), 3) if elapsed else 0.0
+            }
+
+class StagePool:
+    """Thread pool for one stage of the download engine, with its PoolMeter"""
+    
+    def __init__(self, name, workers):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self.meter = PoolMeter(workers)
+    
+    def submit(self, fn, *args):
+        self.meter.enqueue()
+        return self.executor.submit(self._run, fn, args)
+    
+    def _run(self, fn, args):
+        self.meter.begin()
+        try:
+            return fn(*args)
+        finally:
+            self.meter.end()
+    
+    def stats(self):
+        return self.meter.stats()
+
 # Download Queue Manager
 class DownloadQueueManager:
     def __init__(self, max_concurrent=3):
         self.max_concurrent = max_concurrent
-        self.queue = deque()
+        self.queue = PendingQueue()
         self.active_downloads = {}
         self.completed_downloads = {}
         self.download_history = {}
         self.lock = threading.Lock()
+        # Signalled whenever a slot frees up or a pending item appears
+        self.wakeup = threading.Condition(self.lock)
+        # Fixed pool of long-lived workers, one per download slot
+        self.jobs = queue.Queue()
+        self.workers = []
+        self.meter = PoolMeter(max_concurrent)
+        # Active jobs that are past their download and only hold a transcode pool worker
+        self.postprocessing = set()
+        # State version, bumped on every job change, and the version each job last changed at
+        self.version_lock = threading.Lock()
+        self.version = 0
+        self.changes = OrderedDict()
+        # Deltas from before the last prune can't report removals; send a full status instead
+        self.pruned_version = 0
+        # Single flight: the job for each (video, format) and the extra requests sharing it
+        self.single_flight = {}
+        self.requesters = {}
         self.processing_thread = None
         self.start_processing()
     
     def add_to_queue(self, download_info):
-        """Add a download to the queue"""
+        """Add a download to the queue, or share an identical pending, active or recent one"""
         download_id = str(uuid.uuid4())
+        flight_key = single_flight_key(download_info['url'], download_info['format'], download_info.get('profile'))
         
         with self.lock:
+            existing_id = self.single_flight.get(flight_key) if flight_key else None
+            if existing_id and self._attach(existing_id, download_info.get('priority', 0)):
+                app.logger.info(f"Request for {download_info['url']} shares download {existing_id}")
+                return existing_id
+            if flight_key:
+                self.single_flight[flight_key] = download_id
+            
             download_item = {
                 'id': download_id,
                 'url': download_info['url'],
@@ -86,94 +425,279 @@ class DownloadQueueManager:
                 'status': DownloadStatus.PENDING.value,
                 'added_at': datetime.now().isoformat(),
                 'progress': 0,
-                'playlist_limit': download_info.get('playlist_limit')
+                'playlist_limit': download_info.get('playlist_limit'),
+                'parallelism': download_info.get('parallelism'),
+                'profile': download_info.get('profile')
             }
             
-            self.queue.append(download_item)
+            self.queue.push(download_item, download_info.get('priority', 0))
             self.download_history[download_id] = download_item
             
             # Save to database
             self._save_to_db(download_item)
+            self._publish('added', download_item)
+            
+            # Wake the dispatcher so the job starts immediately
+            self.wakeup.notify()
             
         return download_id
     
-    def get_queue_status(self):
-        """Get current queue status"""
+    def _attach(self, download_id, priority=0):
+        """Add a request to an existing job if it is still running or its file is on disk"""
+        download_item = self.download_history.get(download_id)
+        if download_item is None:
+            return False
+        
+        status = download_item['status']
+        if status == DownloadStatus.COMPLETED.value:
+            file_info = completed_downloads.get(download_id)
+            if not file_info or not os.path.exists(file_info.get('filepath', '')):
+                return False
+            if download_id not in progress_bus:
+                # The progress stream was cleaned up; give the new request its completion event
+                progress_bus.publish(download_id, {
+                    'status': 'completed',
+                    'title': file_info['title'],
+                    'artist': file_info['artist'],
+                    'album': file_info['album'],
+                    'download_id': download_id,
+                    'filename': file_info['filename'],
+                    'size': file_info['size']
+                })
+        elif status == DownloadStatus.PENDING.value:
+            # The most urgent request decides when the shared job starts
+            if priority > download_item.get('priority', 0) and self.queue.reprioritize(download_id, priority):
+                self._publish('reprioritized', download_item)
+        elif status != DownloadStatus.ACTIVE.value:
+            return False
+        
+        self.requesters[download_id] = self.requesters.get(download_id, 0) + 1
+        return True
+    
+    def shared_by_others(self, download_id):
+        """True while other requests than the caller's are attached to a job"""
         with self.lock:
-            # Update active downloads with latest progress
-            for download_id, download_item in self.active_downloads.items():
-                if download_id in progress_queues:
-                    try:
-                        # Peek at the latest progress without removing it
-                        progress_queue = progress_queues[download_id]
-                        temp_items = []
-                        latest_progress = None
-                        
-                        # Get all items to find the latest
-                        while not progress_queue.empty():
-                            item = progress_queue.get_nowait()
-                            temp_items.append(item)
-                            latest_progress = item
-                        
-                        # Put them back
-                        for item in temp_items:
-                            progress_queue.put(item)
-                        
-                        # Update download item with latest progress
-                        if latest_progress:
-                            if latest_progress.get('status') == 'downloading':
-                                download_item['progress'] = int(latest_progress.get('percent', '0%').replace('%', ''))
-                                download_item['speed'] = latest_progress.get('speed', 'N/A')
-                                download_item['eta'] = latest_progress.get('eta', 'N/A')
-                            elif latest_progress.get('status') == 'starting':
-                                download_item['title'] = latest_progress.get('title', 'Unknown')
-                                download_item['artist'] = latest_progress.get('artist', '')
-                    except:
-                        pass
+            return self.requesters.get(download_id, 0) > 0
+    
+    def _detach(self, download_id):
+        """Drop one of several requests sharing an unfinished job; False if the caller is the last one (caller holds the lock)"""
+        download_item = self.download_history.get(download_id)
+        unfinished = (DownloadStatus.PENDING.value, DownloadStatus.ACTIVE.value, DownloadStatus.PAUSED.value)
+        if not download_item or download_item['status'] not in unfinished or self.requesters.get(download_id, 0) <= 0:
+            return False
+        self.requesters[download_id] -= 1
+        app.logger.info(f"A request left shared download {download_id}; {self.requesters[download_id] + 1} still attached")
+        return True
+    
+    def release_file(self, download_id):
+        """Record that one request fetched a shared file; True once no other request still needs it"""
+        with self.lock:
+            waiting = self.requesters.pop(download_id, 0)
+            if waiting > 0:
+                self.requesters[download_id] = waiting - 1
+                return False
+            return True
+    
+    def get_queue_status(self, since=None):
+        """Get current queue status, or only the jobs changed after version `since`"""
+        with self.lock:
+            with self.version_lock:
+                version = self.version
+                changed_ids = None
+                if since is not None and self.pruned_version <= since <= version:
+                    # Newest changes are at the end; stop at the first older one
+                    changed_ids = []
+                    for download_id in reversed(self.changes):
+                        if self.changes[download_id] <= since:
+                            break
+                        changed_ids.append(download_id)
             
-            return {
-                'pending': list(self.queue),
-                'active': dict(self.active_downloads),
-                'completed': dict(self.completed_downloads),
-                'history': dict(self.download_history)
-            }
+            if changed_ids is None:
+                status = self._current_state()
+                status['history'] = dict(self.download_history)
+                status['version'] = version
+                return status
+            
+            changes = []
+            for download_id in reversed(changed_ids):
+                download_item = self.download_history.get(download_id)
+                if download_item is None:
+                    continue
+                snapshot = download_progress.get(download_id)
+                if snapshot and download_id in self.active_downloads:
+                    apply_progress_snapshot(download_item, snapshot)
+                changes.append({
+                    'id': download_id,
+                    'section': self._section_of(download_id),
+                    'item': dict(download_item)
+                })
+            return {'version': version, 'since': since, 'changes': changes}
+    
+    def touch(self, download_id):
+        """Record that a job changed and return the new state version"""
+        with self.version_lock:
+            self.version += 1
+            self.changes[download_id] = self.version
+            self.changes.move_to_end(download_id)
+            return self.version
+    
+    def prune_finished(self, max_age=3600):
+        """Forget finished jobs older than max_age seconds; downloads.db keeps their history"""
+        finished = (DownloadStatus.COMPLETED.value, DownloadStatus.FAILED.value, DownloadStatus.CANCELLED.value)
+        cutoff = datetime.now().timestamp() - max_age
+        
+        with self.lock:
+            pruned = []
+            for download_id, download_item in self.download_history.items():
+                if (download_item['status'] in finished
+                        and download_id not in self.active_downloads
+                        and download_id not in self.queue):
+                    finished_at = download_item.get('finished_at') or download_item['added_at']
+                    if datetime.fromisoformat(finished_at).timestamp() < cutoff:
+                        pruned.append(download_id)
+            
+            for download_id in pruned:
+                del self.download_history[download_id]
+                self.completed_downloads.pop(download_id, None)
+                self.requesters.pop(download_id, None)
+            
+            pruned_ids = set(pruned)
+            for flight_key in [key for key, download_id in self.single_flight.items() if download_id in pruned_ids]:
+                del self.single_flight[flight_key]
+            
+            if pruned:
+                with self.version_lock:
+                    for download_id in pruned:
+                        self.changes.pop(download_id, None)
+                    self.version += 1
+                    self.pruned_version = self.version
+                app.logger.info(f"Pruned {len(pruned)} finished downloads from the queue")
+        return len(pruned)
+    
+    def subscribe_events(self, last_event_id=0):
+        """Subscribe to queue changes; returns (snapshot event or None, subscriber)
+        
+        A reconnecting client whose missed events are still in the replay log
+        gets just those; anyone else starts from a full snapshot.
+        """
+        with self.lock:
+            subscriber = queue_events.resume(last_event_id)
+            if subscriber is not None:
+                return None, subscriber
+            
+            snapshot = self._current_state()
+            snapshot['type'] = 'snapshot'
+            seq, subscriber = queue_events.subscribe_latest()
+            return (seq, snapshot), subscriber
+    
+    def _current_state(self):
+        """Pending, active and completed downloads (caller holds the lock)"""
+        # Update active downloads from their latest progress snapshot
+        for download_id, download_item in self.active_downloads.items():
+            snapshot = download_progress.get(download_id)
+            if snapshot:
+                apply_progress_snapshot(download_item, snapshot)
+        
+        return {
+            'pending': self.queue.ordered(),
+            'active': dict(self.active_downloads),
+            'completed': dict(self.completed_downloads)
+        }
+    
+    def _section_of(self, download_id):
+        """Which status list a job belongs to (caller holds the lock)"""
+        if download_id in self.active_downloads:
+            return 'active'
+        if download_id in self.queue:
+            return 'pending'
+        if download_id in self.completed_downloads:
+            return 'completed'
+        return None  # No longer listed (failed or cancelled)
+    
+    def _publish(self, event_type, download_item):
+        """Broadcast a job change to /events subscribers (caller holds the lock)"""
+        download_id = download_item['id']
+        self.touch(download_id)
+        queue_events.publish({
+            'type': event_type,
+            'id': download_id,
+            'section': self._section_of(download_id),
+            'item': dict(download_item)
+        })
     
     def pause_download(self, download_id):
-        """Pause a download"""
+        """Pause a download, keeping its partial files for resume; jobs shared by several requests aren't paused"""
         with self.lock:
-            if download_id in self.active_downloads:
-                # Set cancellation flag
-                if download_id in download_cancelled:
-                    download_cancelled[download_id] = True
+            download_item = self.active_downloads.get(download_id)
+            if self.requesters.get(download_id, 0) > 0:
+                return False
+            if download_item and download_item['status'] == DownloadStatus.ACTIVE.value:
+                # The progress hook stops the transfer on its next tick; the
+                # worker then parks the job in the queue and frees the slot
+                download_paused[download_id] = True
                 
-                # Update status
-                self.active_downloads[download_id]['status'] = DownloadStatus.PAUSED.value
+                download_item['status'] = DownloadStatus.PAUSED.value
                 self.download_history[download_id]['status'] = DownloadStatus.PAUSED.value
                 
-                # Move back to queue for later
-                self.queue.appendleft(self.active_downloads[download_id])
-                del self.active_downloads[download_id]
-                
                 self._update_db_status(download_id, DownloadStatus.PAUSED.value)
+                self._publish('paused', download_item)
                 return True
         return False
     
     def resume_download(self, download_id):
         """Resume a paused download"""
         with self.lock:
-            for i, item in enumerate(self.queue):
-                if item['id'] == download_id and item['status'] == DownloadStatus.PAUSED.value:
-                    item['status'] = DownloadStatus.PENDING.value
-                    self.download_history[download_id]['status'] = DownloadStatus.PENDING.value
-                    self._update_db_status(download_id, DownloadStatus.PENDING.value)
-                    return True
+            item = self.queue.get(download_id) or self.active_downloads.get(download_id)
+            if item and item['status'] == DownloadStatus.PAUSED.value:
+                item['status'] = DownloadStatus.PENDING.value
+                self.download_history[download_id]['status'] = DownloadStatus.PENDING.value
+                # Resumed jobs go ahead of everything else, as paused jobs did before.
+                # A job whose paused run is still winding down is requeued when it stops.
+                if download_id in self.queue:
+                    # Parked jobs have no heap entry; make the job dispatchable again
+                    self.queue.push(item, item.get('priority', 0))
+                    self.queue.move_to_front(download_id)
+                self._update_db_status(download_id, DownloadStatus.PENDING.value)
+                self._publish('resumed', item)
+                self.wakeup.notify()
+                return True
         return False
     
+    def set_priority(self, download_id, priority):
+        """Change the priority of a pending download"""
+        with self.lock:
+            if not self.queue.reprioritize(download_id, priority):
+                return False
+            self._publish('reprioritized', self.queue.get(download_id))
+            return True
+    
+    def set_priorities(self, priorities):
+        """Change the priority of several pending downloads; returns the ids that were found"""
+        with self.lock:
+            updated = [download_id for download_id, priority in priorities.items()
+                       if self.queue.reprioritize(download_id, priority)]
+            for download_id in updated:
+                self._publish('reprioritized', self.queue.get(download_id))
+            return updated
+    
+    def move_to_front(self, download_id):
+        """Make a pending download the next one to start"""
+        with self.lock:
+            if not self.queue.move_to_front(download_id):
+                return False
+            self._publish('reprioritized', self.queue.get(download_id))
+            return True
+    
     def cancel_download(self, download_id):
-        """Cancel a download"""
+        """Cancel a download for the calling request: 'detached' while others share it, else 'cancelled'"""
         with self.lock:
-            # If in queue, remove it
-            self.queue = deque([item for item in self.queue if item['id'] != download_id])
+            # Only the last request sharing a job cancels it
+            if self._detach(download_id):
+                return 'detached'
+            
+            # If in queue, remove it along with any paused progress
+            removed = self.queue.remove(download_id)
+            paused_downloads.pop(download_id, None)
             
             # If active, cancel it
             if download_id in self.active_downloads:
@@ -186,10 +710,22 @@ class DownloadQueueManager:
                 self.download_history[download_id]['status'] = DownloadStatus.CANCELLED.value
                 self._update_db_status(download_id, DownloadStatus.CANCELLED.value)
             
-            return True
+            download_item = removed or self.download_history.get(download_id)
+            if download_item:
+                if removed:
+                    download_item['finished_at'] = datetime.now().isoformat()
+                self._publish('cancelled', download_item)
+            
+            return 'cancelled'
     
     def start_processing(self):
-        """Start the queue processing thread"""
+        """Start the worker pool and the queue processing thread"""
+        if not self.workers:
+            for i in range(self.max_concurrent):
+                worker = threading.Thread(target=self._worker_loop, name=f'download-worker-{i}', daemon=True)
+                worker.start()
+                self.workers.append(worker)
+        
         if not self.processing_thread or not self.processing_thread.is_alive():
             self.processing_thread = threading.Thread(target=self._process_queue, daemon=True)
             self.processing_thread.start()
@@ -198,110 +734,209 @@ class DownloadQueueManager:
         """Process downloads from the queue"""
         while True:
             try:
-                with self.lock:
-                    # Check if we can start more downloads
-                    if len(self.active_downloads) < self.max_concurrent and self.queue:
-                        # Get next item from queue
-                        download_item = None
-                        for item in self.queue:
-                            if item['status'] == DownloadStatus.PENDING.value:
-                                download_item = item
-                                break
-                        
-                        if download_item:
-                            self.queue.remove(download_item)
-                            download_item['status'] = DownloadStatus.ACTIVE.value
-                            self.active_downloads[download_item['id']] = download_item
-                            self.download_history[download_item['id']] = download_item
-                            
-                            # Start download thread
-                            thread = threading.Thread(
-                                target=self._execute_download,
-                                args=(download_item,),
-                                daemon=True
-                            )
-                            thread.start()
-                
-                time.sleep(1)  # Check queue every second
-                
+                with self.wakeup:
+                    self._dispatch_pending()
+                    # Sleep until a download is added, resumed or finishes
+                    self.wakeup.wait()
+                    
             except Exception as e:
                 app.logger.error(f"Error in queue processing: {e}")
     
+    def _dispatch_pending(self):
+        """Start pending downloads until every free slot is filled (caller holds the lock)"""
+        free_slots = self.max_concurrent - len(self.active_downloads) + len(self.postprocessing)
+        if free_slots <= 0 or not self.queue:
+            return
+        
+        for _ in range(free_slots):
+            download_item = self.queue.pop()
+            if download_item is None:
+                break
+            
+            download_item['status'] = DownloadStatus.ACTIVE.value
+            download_item['started_at'] = datetime.now().isoformat()
+            download_item['attempt'] = download_item.get('attempt', 0) + 1
+            self.active_downloads[download_item['id']] = download_item
+            self.download_history[download_item['id']] = download_item
+            self._publish('started', download_item)
+            
+            # Hand the job to a pool worker
+            self.jobs.put((download_item, download_item['attempt']))
+    
+    def _worker_loop(self):
+        """Run queued jobs one at a time and report each outcome"""
+        while True:
+            download_item, attempt = self.jobs.get()
+            self.meter.begin(queued=False)
+            try:
+                file_info = self._execute_download(download_item)
+            except Exception as e:
+                self._on_download_done(download_item, attempt, error=e)
+            else:
+                if isinstance(file_info, Future):
+                    # Downloaded; the transcode pool finishes the job without holding this slot
+                    self._release_slot(download_item, attempt)
+                    file_info.add_done_callback(
+                        lambda future, item=download_item, attempt=attempt: self._on_postprocess_done(item, attempt, future))
+                else:
+                    self._on_download_done(download_item, attempt, file_info=file_info)
+            finally:
+                self.meter.end()
+    
+    def _release_slot(self, download_item, attempt):
+        """Let the next pending job start while this one is transcoded"""
+        with self.lock:
+            if download_item.get('attempt') == attempt and download_item['id'] in self.active_downloads:
+                self.postprocessing.add(download_item['id'])
+                self.wakeup.notify()
+    
+    def _on_postprocess_done(self, download_item, attempt, future):
+        error = future.exception()
+        if error is not None:
+            self._on_download_done(download_item, attempt, error=error)
+        else:
+            self._on_download_done(download_item, attempt, file_info=future.result())
+    
     def _execute_download(self, download_item):
-        """Execute a download"""
+        """Execute a download on a pool worker and return its file info, or a future of it while it's transcoded"""
+        self._update_db_status(download_item['id'], DownloadStatus.ACTIVE.value)
+        
+        return download_video(
+            download_item['url'],
+            download_item['format'],
+            download_item['id'],
+            download_item.get('playlist_limit'),
+            parallelism=download_item.get('parallelism') or 1,
+            profile=download_item.get('profile')
+        )
+    
+    def _on_download_done(self, download_item, attempt, file_info=None, error=None):
+        """Record the outcome of a finished download and free its slot"""
         download_id = download_item['id']
         
-        try:
-            # Update status in database
-            self._update_db_status(download_id, DownloadStatus.ACTIVE.value)
-            
-            # Call the existing download_video function
-            download_video(
-                download_item['url'],
-                download_item['format'],
-                download_id,
-                download_item.get('playlist_limit')
-            )
+        with self.lock:
+            # A paused run that was resumed meanwhile must not touch the new run
+            if download_item.get('attempt') != attempt:
+                return
             
-            # Monitor progress queue for completion
-            timeout = 600  # 10 minutes timeout
-            start_time = time.time()
+            status = download_item['status']
+            finished = error is None and status != DownloadStatus.CANCELLED.value
+            event_type = status  # Cancelled jobs stay cancelled
             
-            while time.time() - start_time < timeout:
-                # Check if download was cancelled
-                if download_cancelled.get(download_id, False):
-                    break
-                    
-                # Check if download completed
-                if download_id in completed_downloads:
-                    with self.lock:
-                        download_item['status'] = DownloadStatus.COMPLETED.value
-                        download_item['completed_at'] = datetime.now().isoformat()
-                        download_item['file_info'] = completed_downloads[download_id]
-                        
-                        self.completed_downloads[download_id] = download_item
-                        if download_id in self.active_downloads:
-                            del self.active_downloads[download_id]
-                        
-                        # Update database
-                        self._update_db_completed(download_id, completed_downloads[download_id])
-                    break
-                    
-                # Check progress queue for error
-                if download_id in progress_queues:
-                    try:
-                        progress_data = progress_queues[download_id].get_nowait()
-                        if progress_data.get('status') == 'error':
-                            raise Exception(progress_data.get('message', 'Unknown error'))
-                        # Put it back if not error
-                        progress_queues[download_id].put(progress_data)
-                    except queue.Empty:
-                        pass
-                        
-                time.sleep(0.5)
+            if status == DownloadStatus.ACTIVE.value or finished:
+                # Also covers a job that finished before a pause took effect
+                if error is not None:
+                    app.logger.error(f"Error executing download {download_id}: {error}")
+                    download_item['status'] = DownloadStatus.FAILED.value
+                    download_item['error'] = str(error)
+                    self._update_db_status(download_id, DownloadStatus.FAILED.value, str(error))
+                    event_type = 'failed'
+                else:
+                    event_type = 'completed'
+                    download_item['status'] = DownloadStatus.COMPLETED.value
+                    download_item['completed_at'] = datetime.now().isoformat()
+                    download_item['file_info'] = file_info
+                    self.completed_downloads[download_id] = download_item
+                    self._update_db_completed(download_id, file_info)
+            elif status == DownloadStatus.PAUSED.value:
+                # Stay listed until resumed
+                self.queue.park(download_item)
+                event_type = 'paused'
+            elif status == DownloadStatus.PENDING.value:
+                # Resumed while the paused run was still stopping
+                self.queue.push(download_item, download_item.get('priority', 0))
+                self.queue.move_to_front(download_id)
+                event_type = 'requeued'
             
+            # Free the slot however the download ended and start the next one
+            self.active_downloads.pop(download_id, None)
+            self.postprocessing.discard(download_id)
+            if event_type in ('completed', 'failed', 'cancelled'):
+                download_item['finished_at'] = datetime.now().isoformat()
+            self._publish(event_type, download_item)
+            self.wakeup.notify()
+    
+    def pool_stats(self):
+        """Download slot metrics; pending jobs are the queue"""
+        with self.lock:
+            queued = len(self.queue)
+        return self.meter.stats(queued=queued)
+    
+    def recover_jobs(self):
+        """Requeue downloads that were pending, active or paused when the process stopped"""
+        try:
+            conn = sqlite3.connect('downloads.db')
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute('''
+                SELECT id, url, format, status, playlist_limit, priority, parallelism, profile, created_at
+                FROM download_history
+                WHERE status IN (?, ?, ?)
+                ORDER BY created_at
+            ''', (DownloadStatus.PENDING.value, DownloadStatus.ACTIVE.value,
+                  DownloadStatus.PAUSED.value)).fetchall()
+            conn.close()
         except Exception as e:
-            app.logger.error(f"Error executing download {download_id}: {e}")
-            with self.lock:
-                download_item['status'] = DownloadStatus.FAILED.value
-                download_item['error'] = str(e)
-                if download_id in self.active_downloads:
-                    del self.active_downloads[download_id]
+            app.logger.error(f"Error loading unfinished downloads: {e}")
+            return 0
+        
+        interrupted = []
+        with self.lock:
+            for row in rows:
+                if row['id'] in self.download_history:
+                    continue
+                
+                download_item = {
+                    'id': row['id'],
+                    'url': row['url'],
+                    'format': row['format'],
+                    'status': DownloadStatus.PENDING.value,
+                    'added_at': row['created_at'],
+                    'progress': 0,
+                    'playlist_limit': row['playlist_limit'],
+                    'parallelism': row['parallelism'],
+                    'profile': row['profile'],
+                    'recovered': True
+                }
+                self.download_history[row['id']] = download_item
                 
-                self._update_db_status(download_id, DownloadStatus.FAILED.value, str(e))
+                if row['status'] == DownloadStatus.PAUSED.value:
+                    download_item['status'] = DownloadStatus.PAUSED.value
+                    download_item['priority'] = row['priority'] or 0
+                    self.queue.park(download_item)
+                else:
+                    self.queue.push(download_item, row['priority'] or 0)
+                    if row['status'] == DownloadStatus.ACTIVE.value:
+                        interrupted.append(row['id'])
+                self._publish('added', download_item)
+            
+            # Jobs cut off mid-transfer go first, oldest first; yt-dlp picks up
+            # their .part files since the output names are derived from metadata
+            for download_id in reversed(interrupted):
+                self.queue.move_to_front(download_id)
+                self._update_db_status(download_id, DownloadStatus.PENDING.value)
+            
+            self.wakeup.notify()
+        
+        if rows:
+            app.logger.info(f"Recovered {len(rows)} unfinished downloads ({len(interrupted)} interrupted)")
+        return len(rows)
     
     def _save_to_db(self, download_item):
         """Save download to database"""
         try:
             conn = sqlite3.connect('downloads.db')
             conn.execute('''
-                INSERT INTO download_history (id, url, format, status)
-                VALUES (?, ?, ?, ?)
+                INSERT INTO download_history (id, url, format, status, playlist_limit, priority, parallelism, profile)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 download_item['id'],
                 download_item['url'],
                 download_item['format'],
-                download_item['status']
+                download_item['status'],
+                download_item.get('playlist_limit'),
+                download_item.get('priority', 0),
+                download_item.get('parallelism'),
+                download_item.get('profile')
             ))
             conn.commit()
             conn.close()
@@ -368,25 +1003,83 @@ class DownloadQueueManager:
 # Initialize the queue manager
 download_queue = DownloadQueueManager(max_concurrent=3)
 
-# Store download progress
+# Latest progress snapshot of each download, replaced whole on every update
 download_progress = {}
-# Each download gets its own queue
-progress_queues = {}
+# Serializes snapshot updates and their events; playlist entries report from several threads
+progress_snapshot_lock = threading.Lock()
+# Each download gets its own progress channel
+progress_bus = ProgressBus()
+# Queue-level changes of every download, streamed by /events
+queue_events = ProgressChannel()
 # Store download threads for cancellation
 download_threads = {}
 # Store cancellation flags
 download_cancelled = {}
+# Store pause flags (a paused download keeps its partial files)
+download_paused = {}
+# Extracted info and playlist position of paused downloads, reused on resume
+paused_downloads = {}
 # Store last activity time for cleanup
 download_last_activity = {}
+# Per-download hook throttling: [last emit time, emitted, suppressed]
+progress_throttle = {}
+# Progress hook calls turned into events vs. coalesced away, across all downloads
+progress_stats = {'emitted': 0, 'suppressed': 0}
+# Guards progress_throttle entries and progress_stats, updated from every worker thread
+progress_stats_lock = threading.Lock()
+# At most this many 'downloading' events per download per second (0 = every hook call)
+PROGRESS_UPDATES_PER_SECOND = 4
+
+# Playlist entries whose metadata is extracted ahead of the one downloading
+PLAYLIST_LOOKAHEAD = 2
+
+# Playlist entries downloading at once: per job, and across all jobs
+MAX_PLAYLIST_PARALLELISM = 8
+MAX_ENTRY_DOWNLOADS = 12
+entry_download_slots = threading.BoundedSemaphore(MAX_ENTRY_DOWNLOADS)
+
+# Encoding and tagging run here, apart from the network download slots
+TRANSCODE_WORKERS = os.cpu_count() or 1
+transcode_pool = StagePool('transcode', TRANSCODE_WORKERS)
 
 # Create temp directory for downloads
 TEMP_DIR = os.path.join(tempfile.gettempdir(), 'vur_de_downloads')
 os.makedirs(TEMP_DIR, exist_ok=True)
+MEDIA_CACHE_DIR = os.path.join(TEMP_DIR, 'media_cache')
+THUMBNAIL_CACHE_DIR = os.path.join(TEMP_DIR, 'thumbnail_cache')
+THUMBNAIL_MAX_AGE = 7 * 86400  # Cached thumbnails unused for this long are removed
+
+def job_dir(download_id):
+    """Directory a download writes into; nothing else shares it"""
+    return os.path.join(TEMP_DIR, download_id)
+
+def remove_job_dir(download_id):
+    """Delete everything a download wrote"""
+    shutil.rmtree(job_dir(download_id), ignore_errors=True)
 
 # Clean up old files on startup (older than 24 hours)
+def unfinished_download_ids():
+    """Ids of downloads that may still resume from their .part files"""
+    unfinished = (DownloadStatus.PENDING.value, DownloadStatus.ACTIVE.value, DownloadStatus.PAUSED.value)
+    with download_queue.lock:
+        ids = set(download_queue.active_downloads)
+        ids.update(item['id'] for item in download_queue.queue.ordered())
+        ids.update(download_id for download_id, item in download_queue.download_history.items()
+                   if item.get('status') in unfinished)
+    ids.update(paused_downloads)
+    try:
+        conn = sqlite3.connect('downloads.db')
+        rows = conn.execute('SELECT id FROM download_history WHERE status IN (?, ?, ?)', unfinished).fetchall()
+        conn.close()
+        ids.update(row[0] for row in rows)
+    except Exception as e:
+        app.logger.error(f"Error loading unfinished downloads: {e}")
+    return ids
+
 def cleanup_old_files():
     try:
         current_time = time.time()
+        keep = unfinished_download_ids()
         for filename in os.listdir(TEMP_DIR):
             filepath = os.path.join(TEMP_DIR, filename)
             if os.path.isfile(filepath):
@@ -394,18 +1087,28 @@ def cleanup_old_files():
                 if file_age > 86400:  # 24 hours in seconds
                     os.remove(filepath)
                     app.logger.info(f"Removed old file: {filename}")
+            elif filepath == THUMBNAIL_CACHE_DIR:
+                # Thumbnails are touched whenever they're served
+                for name in os.listdir(filepath):
+                    if current_time - os.path.getmtime(os.path.join(filepath, name)) > THUMBNAIL_MAX_AGE:
+                        os.remove(os.path.join(filepath, name))
+            elif filepath != MEDIA_CACHE_DIR:
+                # Job directories; unfinished jobs keep theirs to resume from
+                if filename in keep:
+                    continue
+                if current_time - os.path.getmtime(filepath) > 86400:
+                    shutil.rmtree(filepath, ignore_errors=True)
+                    app.logger.info(f"Removed old job directory: {filename}")
     except Exception as e:
         app.logger.error(f"Error cleaning up old files: {e}")
 
-# Run cleanup on startup
-cleanup_old_files()
-
 # Store completed downloads info
 completed_downloads = {}
 
 # Rate limiting for preview requests
 preview_rate_limit = {}
 PREVIEW_RATE_LIMIT_SECONDS = 2  # Allow 1 preview every 2 seconds per IP
+PREVIEW_PAGE_SIZE = 10  # Playlist entries per preview page
 
 # Cleanup old downloads from memory after 1 hour
 def cleanup_old_downloads():
@@ -437,7 +1140,7 @@ def cleanup_expired_downloads():
         
         # Find expired downloads
         cursor.execute('''
-            SELECT id, file_path FROM download_history 
+            SELECT id FROM download_history 
             WHERE expires_at < datetime('now') 
             AND status = ? 
             AND file_path IS NOT NULL
@@ -445,18 +1148,11 @@ def cleanup_expired_downloads():
         
         expired_downloads = cursor.fetchall()
         
-        for download_id, file_path in expired_downloads:
-            # Delete files from disk
-            if file_path and os.path.exists(file_path):
-                try:
-                    # If it's a directory (for playlists), remove all files
-                    if os.path.isdir(file_path):
-                        shutil.rmtree(file_path)
-                    else:
-                        os.remove(file_path)
-                    app.logger.info(f"Deleted expired file: {file_path}")
-                except Exception as e:
-                    app.logger.error(f"Error deleting file {file_path}: {e}")
+        for (download_id,) in expired_downloads:
+            # Delete files from disk; a job's files all live in its directory
+            if os.path.isdir(job_dir(download_id)):
+                remove_job_dir(download_id)
+                app.logger.info(f"Deleted expired files of {download_id}")
             
             # Remove from completed_downloads if still there
             if download_id in completed_downloads:
@@ -488,17 +1184,27 @@ def cleanup_stale_downloads():
         
         downloads_to_remove = []
         
-        # Check last activity time
-        for download_id, last_activity in download_last_activity.items():
-            if current_time - last_activity > stale_threshold:
-                downloads_to_remove.append(download_id)
+        # Check last activity time; jobs still running, queued or paused can be
+        # quiet for long (a transcode, a pause) and keep their channel and state
+        with download_queue.lock:
+            for download_id, last_activity in list(download_last_activity.items()):
+                if (current_time - last_activity > stale_threshold
+                        and download_id not in download_queue.active_downloads
+                        and download_id not in download_queue.queue
+                        and download_id not in paused_downloads):
+                    downloads_to_remove.append(download_id)
         
         # Remove stale download data
         for download_id in downloads_to_remove:
-            if download_id in progress_queues:
-                del progress_queues[download_id]
+            progress_bus.remove(download_id)
+            with progress_stats_lock:
+                progress_throttle.pop(download_id, None)
+            with progress_snapshot_lock:
+                download_progress.pop(download_id, None)
             if download_id in download_cancelled:
                 del download_cancelled[download_id]
+            if download_id in download_paused and download_id not in paused_downloads:
+                del download_paused[download_id]
             if download_id in download_last_activity:
                 del download_last_activity[download_id]
             if download_id in download_threads:
@@ -517,9 +1223,45 @@ def cleanup_stale_downloads():
     except Exception as e:
         app.logger.error(f"Error cleaning up stale downloads: {e}")
 
+# Served files stay for retries and resumed transfers: they are removed once a
+# transfer reaches the end of the file, or after this long without a request
+SERVED_FILE_GRACE_SECONDS = 1800
+served_file_deadlines = {}  # download id -> time the files may be removed
+served_files_lock = threading.Lock()
+
+def hold_served_files(download_id):
+    """Keep a served download's files for another grace period"""
+    with served_files_lock:
+        served_file_deadlines[download_id] = time.time() + SERVED_FILE_GRACE_SECONDS
+
+def release_served_files(download_id):
+    """A transfer reached the end of the file: remove it once every request sharing it has it"""
+    if download_queue.release_file(download_id):
+        with served_files_lock:
+            served_file_deadlines.pop(download_id, None)
+        remove_job_dir(download_id)
+
+def cleanup_served_files():
+    """Remove served files whose grace period ran out without a confirmed transfer"""
+    try:
+        current_time = time.time()
+        with served_files_lock:
+            expired = [download_id for download_id, deadline in served_file_deadlines.items()
+                       if deadline < current_time]
+            for download_id in expired:
+                del served_file_deadlines[download_id]
+        
+        for download_id in expired:
+            remove_job_dir(download_id)
+            app.logger.info(f"Removed served files of {download_id} after the grace period")
+    except Exception as e:
+        app.logger.error(f"Error cleaning up served files: {e}")
+
 # Schedule periodic cleanup
 def schedule_cleanup():
     cleanup_old_downloads()
+    cleanup_served_files()
+    download_queue.prune_finished()
     cleanup_old_files()
     cleanup_stale_downloads()  # Add stale download cleanup
     cleanup_expired_downloads()  # Add expired download cleanup
@@ -528,11 +1270,556 @@ def schedule_cleanup():
     timer.daemon = True
     timer.start()
 
-# Start the cleanup scheduler
-schedule_cleanup()
 
-def update_id3_tags(filepath, title, artist, album):
-    """Update ID3 tags for MP3 files"""
+# Extracted info dicts, shared by /preview and downloads
+INFO_CACHE_SIZE = 256      # Extractions kept
+INFO_CACHE_TTL = 1800      # Seconds; stream URLs inside the info expire after a few hours
+
+class InfoCache:
+    """LRU cache of yt-dlp info dicts with a time-to-live.
+    
+    Cached dicts are shared: callers must copy before handing one to
+    yt-dlp, which mutates what it processes.
+    """
+    
+    def __init__(self, maxsize=INFO_CACHE_SIZE, ttl=INFO_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (expires_at, info)
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+    
+    def put(self, keys, info):
+        expires_at = time.monotonic() + self.ttl
+        with self.lock:
+            for key in keys:
+                self.entries[key] = (expires_at, info)
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+    
+    def stats(self):
+        with self.lock:
+            return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+info_cache = InfoCache()
+
+YOUTUBE_HOSTS = ('youtube.com', 'www.youtube.com', 'm.youtube.com', 'music.youtube.com', 'youtu.be')
+
+def info_cache_key(url, flat):
+    """Cache key for a URL: the video id for YouTube videos, else the normalized URL"""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    query = parse_qs(parts.query)
+    
+    if host in YOUTUBE_HOSTS and 'list' not in query:
+        if host == 'youtu.be':
+            video_id = parts.path.strip('/')
+        elif parts.path.startswith(('/shorts/', '/live/', '/embed/')):
+            video_id = parts.path.split('/')[2]
+        else:
+            video_id = query.get('v', [None])[0]
+        if video_id:
+            # Same key yt-dlp's info gives the video, so playlist entries hit it too
+            return f"Youtube:{video_id}"
+    
+    # Playlists are only ever extracted flat, other URLs may be either
+    normalized = f"{host}{parts.path.rstrip('/')}?{'&'.join(sorted(parts.query.split('&')))}"
+    return f"{'flat' if flat else 'full'}:{normalized}"
+
+def extract_info_cached(url, flat=False, key=None):
+    """Extract info without downloading, reusing a recent extraction of the same URL or video"""
+    key = key or info_cache_key(url, flat)
+    info = info_cache.get(key)
+    if info is not None:
+        return info
+    
+    with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True, 'extract_flat': flat}) as ydl:
+        info = ydl.extract_info(url, download=False)
+    
+    info_cache.put(info_cache_keys(key, info), info)
+    return info
+
+def info_cache_keys(key, info):
+    """Keys to cache an extraction under"""
+    keys = [key]
+    if 'entries' not in info and info.get('extractor_key') and info.get('id'):
+        # A full video: also findable by id from playlist entries and other URLs
+        keys.append(f"{info['extractor_key']}:{info['id']}")
+    return keys
+
+def extract_preview_page(url, start, count):
+    """Flat info for `count` playlist entries from `start` (1-based), without enumerating the rest
+    
+    Returns (info, entries, total). entries is None when the URL is a single
+    video, and total is None while the playlist has not been counted.
+    """
+    key = info_cache_key(url, True)
+    info = info_cache.get(key)
+    if info is not None:
+        # The whole playlist (or the video) was already extracted
+        if 'entries' not in info:
+            return info, None, None
+        return info, info['entries'][start - 1:start - 1 + count], len(info['entries'])
+    
+    page_key = f"{key}#{start}-{start + count - 1}"
+    info = info_cache.get(page_key)
+    if info is None:
+        ydl_opts = {
+            'quiet': True,
+            'no_warnings': True,
+            'extract_flat': True,  # Don't download, just extract info
+            'lazy_playlist': True,  # Stop paging once the requested items are in
+            'playlist_items': f"{start}-{start + count - 1}",
+        }
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=False)
+        
+        if 'entries' not in info:
+            # A single video: its info is complete, cache it for the download
+            info_cache.put(info_cache_keys(key, info), info)
+            return info, None, None
+        info_cache.put([page_key], info)
+    
+    return info, info['entries'], info.get('playlist_count')
+
+# Background playlist counts for the preview, while they run
+playlist_counts = {}  # flat cache key -> {'done': Event, 'total': int, 'capped': bool, 'error': str}
+playlist_counts_lock = threading.Lock()
+# Counting stops past this many entries; a longer playlist shows as "at least" this many
+PLAYLIST_COUNT_MAX = 5000
+
+def start_playlist_count(url):
+    """Count a playlist's entries in the background and return the count job"""
+    key = info_cache_key(url, True)
+    with playlist_counts_lock:
+        job = playlist_counts.get(key)
+        if job is None:
+            job = playlist_counts[key] = {'done': threading.Event(), 'total': None, 'capped': False, 'error': None}
+            threading.Thread(target=count_playlist, args=(url, key, job), daemon=True).start()
+    return job
+
+def count_playlist(url, key, job):
+    """Enumerate a playlist up to PLAYLIST_COUNT_MAX entries
+    
+    A playlist within the cap is cached whole for the download; a longer one
+    only has its capped count cached, so the truncated extraction isn't reused.
+    """
+    count_key = f"{key}#count"
+    try:
+        info = info_cache.get(key) or info_cache.get(count_key)
+        if info is None:
+            ydl_opts = {
+                'quiet': True,
+                'no_warnings': True,
+                'extract_flat': True,
+                'lazy_playlist': True,
+                'playlist_items': f"1-{PLAYLIST_COUNT_MAX + 1}",  # One more tells a longer playlist apart
+            }
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                info = ydl.extract_info(url, download=False)
+            if len(info.get('entries') or []) > PLAYLIST_COUNT_MAX:
+                info = {'counted': PLAYLIST_COUNT_MAX, 'capped': True}
+                info_cache.put([count_key], info)
+            else:
+                info_cache.put(info_cache_keys(key, info), info)
+        
+        if info.get('capped'):
+            job['total'], job['capped'] = info['counted'], True
+        else:
+            job['total'] = len(info.get('entries') or [])
+    except Exception as e:
+        app.logger.error(f"Error counting playlist {url}: {e}")
+        job['error'] = str(e)
+    finally:
+        with playlist_counts_lock:
+            playlist_counts.pop(key, None)
+        job['done'].set()
+
+def playlist_page_counts(total_videos, playlist_limit, per_page):
+    """Totals shown by the playlist preview"""
+    download_count = min(playlist_limit, total_videos) if playlist_limit else total_videos
+    return {
+        'total_videos': total_videos,
+        'download_count': download_count,
+        'total_pages': (download_count + per_page - 1) // per_page
+    }
+
+def single_flight_key(url, format_type, profile=None):
+    """Identity of a single-video download: same video, same format and profile; None for playlists"""
+    if 'playlist' in url or 'list=' in url:
+        return None
+    return (info_cache_key(url, False), format_type, media_profile(format_type, profile))
+
+def extract_entry_info(entry):
+    """Full info for a flat playlist entry, from the cache when possible"""
+    video_url = entry.get('url') or entry.get('webpage_url') or f"https://www.youtube.com/watch?v={entry.get('id')}"
+    key = f"{entry['ie_key']}:{entry['id']}" if entry.get('ie_key') and entry.get('id') else None
+    return extract_info_cached(video_url, key=key)
+
+# Finished media files, reused across jobs within a byte budget
+MEDIA_CACHE_MAX_BYTES = 2 * 1024 ** 3  # 2 GiB
+MEDIA_CACHE_POLICY = 'lru'  # 'lru' evicts the least recently used file, 'lfu' the least used
+
+def link_file(source, destination):
+    """Hard-link a file, copying it where links aren't possible"""
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+class MediaCache:
+    """Downloaded files keyed by video, format and postprocessing profile
+    
+    Files are stored under a hash of their key next to a JSON sidecar with
+    the track metadata, so the index survives restarts. Jobs get a hard link
+    (or copy) of a cached file, so deleting a job's file never touches it.
+    """
+    
+    def __init__(self, directory, max_bytes=MEDIA_CACHE_MAX_BYTES, policy=MEDIA_CACHE_POLICY):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # digest -> metadata, least recently used first
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+    
+    def _load(self):
+        """Rebuild the index from the sidecars of an earlier run, oldest access first"""
+        found = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    meta = json.load(f)
+                accessed = os.path.getatime(os.path.join(self.directory, meta['stored_as']))
+            except Exception:
+                continue  # Half-written entry; its file is overwritten when cached again
+            found.append((accessed, name[:-len('.json')], meta))
+        
+        with self.lock:
+            for _, digest, meta in sorted(found, key=lambda item: item[0]):
+                meta['uses'] = 0
+                self.entries[digest] = meta
+                self.bytes += meta['size']
+            self._evict()
+    
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+    
+    def __contains__(self, key):
+        return key is not None and hashlib.sha1(key.encode()).hexdigest() in self.entries
+    
+    def get(self, key, download_dir):
+        """Link a cached file into download_dir and return its file info, or None on a miss"""
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        with self.lock:
+            meta = self.entries.get(digest)
+            if meta is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(digest)
+            meta['uses'] += 1
+            self.hits += 1
+        
+        filepath = os.path.join(download_dir, meta['filename'])
+        try:
+            if not os.path.exists(filepath):
+                link_file(self._path(meta['stored_as']), filepath)
+        except OSError as e:
+            # Evicted between the lookup and the link
+            app.logger.error(f"Error reading {key} from the media cache: {e}")
+            return None
+        
+        return {
+            'filename': meta['filename'],
+            'filepath': filepath,
+            'title': meta['title'],
+            'artist': meta['artist'],
+            'album': meta['album'],
+            'size': meta['size']
+        }
+    
+    def put(self, key, file_info):
+        """Keep a finished, tagged file, evicting others to stay within the budget"""
+        if file_info['size'] > self.max_bytes:
+            return
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        with self.lock:
+            if digest in self.entries:
+                return
+        
+        meta = {
+            'key': key,
+            'stored_as': digest + os.path.splitext(file_info['filename'])[1],
+            'filename': file_info['filename'],
+            'title': file_info['title'],
+            'artist': file_info['artist'],
+            'album': file_info['album'],
+            'size': file_info['size']
+        }
+        try:
+            link_file(file_info['filepath'], self._path(meta['stored_as']))
+            with open(self._path(f"{digest}.json"), 'w') as f:
+                json.dump(meta, f)
+        except Exception as e:
+            app.logger.error(f"Error adding {key} to the media cache: {e}")
+            return
+        
+        with self.lock:
+            if digest in self.entries:
+                return
+            meta['uses'] = 0
+            self.entries[digest] = meta
+            self.bytes += meta['size']
+            self._evict(keep=digest)
+    
+    def _evict(self, keep=None):
+        """Drop files until the cache fits its budget; call with the lock held"""
+        while self.bytes > self.max_bytes:
+            candidates = [digest for digest in self.entries if digest != keep]
+            if not candidates:
+                break
+            if self.policy == 'lfu':
+                # Least used first; ties go to the least recently used
+                digest = min(candidates, key=lambda d: self.entries[d]['uses'])
+            else:
+                digest = candidates[0]
+            
+            meta = self.entries.pop(digest)
+            self.bytes -= meta['size']
+            self.evictions += 1
+            for name in (meta['stored_as'], f"{digest}.json"):
+                try:
+                    os.remove(self._path(name))
+                except OSError:
+                    pass
+    
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'policy': self.policy,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+media_cache = MediaCache(MEDIA_CACHE_DIR)
+
+# Output profiles of each format, default first: 'mp3' encodes at a chosen
+# bitrate, 'native' keeps the source Opus or AAC stream, 'mp4' merges MP4 and
+# M4A streams and 'remux' merges the best streams of any codec. Only 'mp3'
+# encodes; the others copy streams.
+FORMAT_PROFILES = {
+    'audio': ('mp3', 'native'),
+    'video': ('mp4', 'remux'),
+}
+MP3_BITRATES = (128, 192, 256, 320)
+DEFAULT_MP3_BITRATE = 192
+
+def media_profile(format_type, profile=None, bitrate=None):
+    """Full name of the profile a file is produced with, e.g. 'mp3-192'; the default if none is given"""
+    if format_type == 'audio':
+        profile = profile or FORMAT_PROFILES['audio'][0]
+        if profile == 'mp3':
+            return f"mp3-{bitrate or DEFAULT_MP3_BITRATE}"
+        return profile
+    return profile or FORMAT_PROFILES['video'][0]
+
+def mp3_bitrate(profile):
+    """Bitrate in kbps of an MP3 profile, None for the other profiles"""
+    if profile and profile.startswith('mp3-'):
+        return int(profile[4:])
+    return None
+
+def media_cache_key(video_key, format_type, profile=None):
+    """Media cache key of a video in a format and profile, or None if the video is unknown"""
+    if not video_key:
+        return None
+    return f"{video_key}/{format_type}/{media_profile(format_type, profile)}"
+
+def video_key_of(info):
+    """extractor:id of an extracted video or a flat playlist entry"""
+    extractor = info.get('extractor_key') or info.get('ie_key')
+    if extractor and info.get('id'):
+        return f"{extractor}:{info['id']}"
+    return None
+
+def url_video_key(url):
+    """extractor:id of a video URL, when it can be told without extracting"""
+    key = info_cache_key(url, False)
+    return key if key.startswith('Youtube:') else None
+
+# Longest side of each thumbnail variant, in pixels
+THUMBNAIL_SIZES = {'cover': 600, 'preview': 320}
+
+def thumbnail_source(info):
+    """URL of the best thumbnail of an extracted video or a flat playlist entry"""
+    if info.get('thumbnail'):
+        return info['thumbnail']
+    thumbnails = [t for t in info.get('thumbnails') or [] if t.get('url')]
+    return thumbnails[-1]['url'] if thumbnails else None
+
+class ThumbnailCache:
+    """Resized thumbnails for cover art and previews, keyed by video
+    
+    Each source image is fetched once and stored as one JPEG per size in
+    THUMBNAIL_SIZES, under a hash of its URL; videos sharing an image (a
+    playlist with one album cover) share the files. A JSON sidecar per video
+    records its source, so /thumb works for videos seen before a restart.
+    """
+    
+    def __init__(self, directory, sizes=THUMBNAIL_SIZES):
+        self.directory = directory
+        self.sizes = sizes
+        self.lock = threading.Lock()
+        self.sources = {}  # video key -> source URL
+        self.fetching = {}  # source URL -> Future of its stored name, shared by concurrent requests
+        self.hits = 0
+        self.fetches = 0
+        self.failures = 0
+        os.makedirs(directory, exist_ok=True)
+    
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+    
+    def remember(self, video_key, source):
+        """Note where a video's thumbnail comes from, without fetching it"""
+        if not video_key or not source:
+            return
+        with self.lock:
+            if self.sources.get(video_key) == source:
+                return
+            self.sources[video_key] = source
+        try:
+            with open(self._path(f"{hashlib.sha1(video_key.encode()).hexdigest()}.json"), 'w') as f:
+                json.dump({'key': video_key, 'source': source}, f)
+        except OSError as e:
+            app.logger.error(f"Error saving the thumbnail source of {video_key}: {e}")
+    
+    def source_of(self, video_key):
+        with self.lock:
+            source = self.sources.get(video_key)
+        if source is None:
+            try:
+                with open(self._path(f"{hashlib.sha1(video_key.encode()).hexdigest()}.json")) as f:
+                    source = json.load(f)['source']
+            except Exception:
+                # YouTube serves a thumbnail for every video id at a fixed address
+                if video_key.startswith('Youtube:'):
+                    source = f"https://i.ytimg.com/vi/{video_key.split(':', 1)[1]}/hqdefault.jpg"
+            if source:
+                with self.lock:
+                    self.sources.setdefault(video_key, source)
+        return source
+    
+    def get(self, video_key, size, source=None):
+        """Path of a video's thumbnail at a size, fetching it on a miss; None if there is none"""
+        source = source or (self.source_of(video_key) if video_key else None)
+        if not source or size not in self.sizes:
+            return None
+        self.remember(video_key, source)
+        
+        name = hashlib.sha1(source.encode()).hexdigest()
+        path = self._path(f"{name}-{size}.jpg")
+        if os.path.exists(path):
+            with self.lock:
+                self.hits += 1
+            try:
+                os.utime(path)  # Keeps it from being pruned
+            except OSError:
+                pass
+            return path
+        
+        with self.lock:
+            future = self.fetching.get(source)
+            owner = future is None
+            if owner:
+                future = self.fetching[source] = Future()
+            else:
+                self.hits += 1  # Rides on a fetch already under way
+        if owner:
+            try:
+                self._fetch(source, name)
+                future.set_result(name)
+            except Exception as e:
+                app.logger.error(f"Error fetching thumbnail {source}: {e}")
+                with self.lock:
+                    self.failures += 1
+                future.set_result(None)
+            finally:
+                with self.lock:
+                    self.fetching.pop(source, None)
+        return path if future.result() and os.path.exists(path) else None
+    
+    def _fetch(self, source, name):
+        """Download a source image once and store every size of it"""
+        with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
+            data = ydl.urlopen(source).read()
+        with self.lock:
+            self.fetches += 1
+        
+        original = self._path(f"{name}.orig")
+        with open(original, 'wb') as f:
+            f.write(data)
+        try:
+            for size, pixels in self.sizes.items():
+                target = self._path(f"{name}-{size}.jpg")
+                temp_path = target + '.part'
+                # Fit within pixels x pixels, never upscaling
+                try:
+                    result = subprocess.run([
+                        'ffmpeg', '-v', 'error', '-y', '-i', original, '-frames:v', '1',
+                        '-vf', f"scale='min({pixels},iw)':'min({pixels},ih)':force_original_aspect_ratio=decrease",
+                        '-q:v', '3', '-f', 'image2', temp_path
+                    ], capture_output=True)
+                    error = result.stderr.decode(errors='replace').strip() if result.returncode else None
+                except OSError as e:
+                    error = str(e)  # No ffmpeg
+                if error is not None:
+                    if not data.startswith(b'\xff\xd8'):
+                        raise RuntimeError(error or 'ffmpeg failed')
+                    # A JPEG is still usable at full size
+                    shutil.copyfile(original, temp_path)
+                os.replace(temp_path, target)
+        finally:
+            os.remove(original)
+    
+    def stats(self):
+        with self.lock:
+            return {
+                'sources': len(self.sources),
+                'hits': self.hits,
+                'fetches': self.fetches,
+                'failures': self.failures
+            }
+
+thumbnail_cache = ThumbnailCache(THUMBNAIL_CACHE_DIR)
+
+def update_id3_tags(filepath, title, artist, album, cover=None):
+    """Write ID3 tags and cover art to an MP3 file in a single save"""
     try:
         from mutagen.mp3 import MP3
         from mutagen.id3 import ID3, TIT2, TPE1, TALB, APIC
@@ -552,6 +1839,12 @@ def update_id3_tags(filepath, title, artist, album):
             audio.tags['TPE1'] = TPE1(encoding=3, text=artist)
         if album:
             audio.tags['TALB'] = TALB(encoding=3, text=album)
+        if cover:
+            with open(cover, 'rb') as f:
+                data = f.read()
+            audio.tags.delall('APIC')
+            audio.tags.add(APIC(encoding=3, mime=COVER_MIME_TYPES.get(os.path.splitext(cover)[1].lower(), 'image/jpeg'),
+                                type=3, desc='Cover', data=data))
         
         # Save the tags
         audio.save()
@@ -562,18 +1855,157 @@ def update_id3_tags(filepath, title, artist, album):
     except Exception as e:
         app.logger.error(f"Error updating ID3 tags: {e}")
 
-def create_progress_hook(download_id, playlist_index=None, playlist_total=None):
+def update_mp4_tags(filepath, title, artist, album, cover=None):
+    """Write iTunes-style tags and cover art to an MP4 or M4A file in a single save"""
+    try:
+        from mutagen.mp4 import MP4, MP4Cover
+        
+        media = MP4(filepath)
+        if media.tags is None:
+            media.add_tags()
+        
+        media.tags['\xa9nam'] = [title]
+        if artist:
+            media.tags['\xa9ART'] = [artist]
+        if album:
+            media.tags['\xa9alb'] = [album]
+        # MP4 covers can only be JPEG or PNG
+        image_format = {'image/jpeg': MP4Cover.FORMAT_JPEG, 'image/png': MP4Cover.FORMAT_PNG}.get(
+            COVER_MIME_TYPES.get(os.path.splitext(cover)[1].lower())) if cover else None
+        if image_format is not None:
+            with open(cover, 'rb') as f:
+                media.tags['covr'] = [MP4Cover(f.read(), imageformat=image_format)]
+        
+        media.save()
+        app.logger.info(f"Updated MP4 tags for {filepath}: {artist} - {title} - {album}")
+        
+    except ImportError:
+        app.logger.warning("Mutagen not installed, skipping MP4 tag update")
+    except Exception as e:
+        app.logger.error(f"Error updating MP4 tags: {e}")
+
+def update_vorbis_tags(filepath, title, artist, album, cover=None):
+    """Write Vorbis comments and cover art to an Ogg (Opus or Vorbis) file in a single save"""
+    try:
+        import base64
+        import mutagen
+        from mutagen.flac import Picture
+        
+        media = mutagen.File(filepath)
+        if media is None:
+            raise ValueError('unknown container')
+        if media.tags is None:
+            media.add_tags()
+        
+        media.tags['title'] = [title]
+        if artist:
+            media.tags['artist'] = [artist]
+        if album:
+            media.tags['album'] = [album]
+        if cover:
+            picture = Picture()
+            picture.type = 3  # Front cover
+            picture.mime = COVER_MIME_TYPES.get(os.path.splitext(cover)[1].lower(), 'image/jpeg')
+            picture.desc = 'Cover'
+            with open(cover, 'rb') as f:
+                picture.data = f.read()
+            media.tags['metadata_block_picture'] = [base64.b64encode(picture.write()).decode('ascii')]
+        
+        media.save()
+        app.logger.info(f"Updated Vorbis comments for {filepath}: {artist} - {title} - {album}")
+        
+    except ImportError:
+        app.logger.warning("Mutagen not installed, skipping Vorbis comment update")
+    except Exception as e:
+        app.logger.error(f"Error updating Vorbis comments: {e}")
+
+# Tag writer for each container mutagen can edit in place; MKV and WebM are
+# tagged by the ffmpeg merge instead
+TAG_WRITERS = {
+    '.mp3': update_id3_tags,
+    '.mp4': update_mp4_tags,
+    '.m4a': update_mp4_tags,
+    '.opus': update_vorbis_tags,
+    '.ogg': update_vorbis_tags,
+}
+
+def update_tags(filepath, title, artist, album, cover=None):
+    """Write tags and cover art with the writer for the file's container"""
+    writer = TAG_WRITERS.get(os.path.splitext(filepath)[1].lower())
+    if writer is None:
+        app.logger.info(f"No tag writer for {filepath}, leaving its tags as they are")
+        return
+    writer(filepath, title, artist, album, cover)
+
+# Image types a cover file can have
+COVER_MIME_TYPES = {'.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png', '.webp': 'image/webp'}
+
+# Snapshot fields copied from progress events of the same name
+SNAPSHOT_FIELDS = ('status', 'title', 'artist', 'album', 'playlist_title', 'playlist_index', 'playlist_total')
+
+def emit_progress(download_id, progress_data, **snapshot_fields):
+    """Send a progress event to the download's stream and update its snapshot"""
+    with progress_snapshot_lock:
+        # Build a new snapshot and swap it in so readers never see a half-updated one
+        snapshot = dict(download_progress.get(download_id, {}))
+        snapshot.update((key, progress_data[key]) for key in SNAPSHOT_FIELDS if key in progress_data)
+        snapshot.update(snapshot_fields)
+        snapshot['updated_at'] = time.time()
+        download_progress[download_id] = snapshot
+        download_last_activity[download_id] = snapshot['updated_at']
+        if download_id in download_queue.download_history:
+            download_queue.touch(download_id)
+        
+        # Published under the lock so events go out in snapshot order
+        progress_bus.publish(download_id, progress_data)
+        queue_events.publish({'type': 'progress', 'id': download_id, 'progress': apply_progress_snapshot({}, snapshot)})
+
+def apply_progress_snapshot(download_item, snapshot):
+    """Copy a progress snapshot onto a queue item for /queue/status"""
+    if snapshot.get('percent') is not None:
+        download_item['progress'] = int(snapshot['percent'])
+    speed = snapshot.get('speed')
+    eta = snapshot.get('eta')
+    download_item['speed'] = f"{yt_dlp.utils.format_bytes(speed)}/s" if speed else 'N/A'
+    download_item['eta'] = yt_dlp.utils.formatSeconds(eta) if eta is not None else 'N/A'
+    for key in ('title', 'artist', 'playlist_index', 'playlist_total'):
+        if key in snapshot:
+            download_item[key] = snapshot[key]
+    return download_item
+
+def create_progress_hook(download_id, playlist_index=None, playlist_total=None,
+                         max_rate=PROGRESS_UPDATES_PER_SECOND):
+    # Shared by every hook of the download so playlist entries share one budget
+    with progress_stats_lock:
+        throttle = progress_throttle.setdefault(download_id, [0.0, 0, 0])
+    min_interval = 1.0 / max_rate if max_rate else 0.0
+    
     def progress_hook(d):
         # Check if download was cancelled
         if download_id in download_cancelled and download_cancelled[download_id]:
             raise Exception("Download cancelled by user")
-            
-        # Get or create queue for this download
-        if download_id not in progress_queues:
-            progress_queues[download_id] = queue.Queue()
-        progress_queue = progress_queues[download_id]
+        if download_paused.get(download_id):
+            raise DownloadPaused("Download paused by user")
+        
+        # Coalesce ticks before building anything; state changes always go out
+        status = d['status']
+        if status not in ('downloading', 'finished'):
+            return
+        with progress_stats_lock:
+            if status == 'downloading':
+                now = time.monotonic()
+                if now - throttle[0] < min_interval:
+                    throttle[2] += 1
+                    progress_stats['suppressed'] += 1
+                    return
+                throttle[0] = now
+            else:
+                # Let the next entry's first tick through
+                throttle[0] = 0.0
+            throttle[1] += 1
+            progress_stats['emitted'] += 1
         
-        if d['status'] == 'downloading':
+        if status == 'downloading':
             progress_data = {
                 'status': 'downloading',
                 'percent': d.get('_percent_str', 'N/A'),
@@ -584,8 +2016,23 @@ def create_progress_hook(download_id, playlist_index=None, playlist_total=None):
             if playlist_index:
                 progress_data['playlist_index'] = playlist_index
                 progress_data['playlist_total'] = playlist_total
-            progress_queue.put(progress_data)
-        elif d['status'] == 'finished':
+            
+            # Numeric values for the snapshot; fragmented downloads only know fragment counts
+            downloaded = d.get('downloaded_bytes') or 0
+            total = d.get('total_bytes') or d.get('total_bytes_estimate')
+            if total:
+                percent = downloaded * 100 / total
+            elif d.get('fragment_count'):
+                percent = (d.get('fragment_index') or 0) * 100 / d['fragment_count']
+            else:
+                percent = None
+            emit_progress(download_id, progress_data,
+                          percent=round(percent, 1) if percent is not None else None,
+                          downloaded_bytes=downloaded,
+                          total_bytes=total,
+                          speed=d.get('speed'),
+                          eta=d.get('eta'))
+        else:
             progress_data = {
                 'status': 'finished',
                 'filename': d.get('filename', 'Unknown')
@@ -593,370 +2040,452 @@ def create_progress_hook(download_id, playlist_index=None, playlist_total=None):
             if playlist_index:
                 progress_data['playlist_index'] = playlist_index
                 progress_data['playlist_total'] = playlist_total
-            progress_queue.put(progress_data)
+            emit_progress(download_id, progress_data, percent=100.0, speed=None, eta=0)
     return progress_hook
 
-def download_video(url, format_type, download_id, playlist_limit=None):
+def clean_filename(s):
+    # Remove problematic characters but keep more valid ones
+    return "".join(c for c in s if c.isalnum() or c in (' ', '-', '_', '.', '(', ')', '[', ']', ',')).strip()
+
+def get_track_metadata(video_info):
+    """Title, artist and album of a video"""
+    title = video_info.get('title', 'Unknown')
+    artist = video_info.get('artist', video_info.get('uploader', video_info.get('channel', '')))
+    album = video_info.get('album', '')
+    return title, artist, album
+
+def build_base_filename(title, artist, album):
+    """Output file name, without extension, from the track metadata"""
+    safe_title = clean_filename(title)
+    safe_artist = clean_filename(artist) if artist else ''
+    safe_album = clean_filename(album) if album else ''
+    
+    # Build filename based on available metadata
+    if safe_artist and safe_album:
+        return f"{safe_artist} - {safe_title} - {safe_album}"
+    elif safe_artist:
+        return f"{safe_artist} - {safe_title}"
+    else:
+        return safe_title
+
+def build_download_opts(format_type, progress_hook, outtmpl, profile=None, metadata=None):
+    """yt-dlp options for downloading one video in the requested format and profile"""
+    opts = {
+        'quiet': False,
+        'no_warnings': False,
+        'continuedl': True,  # Resume .part files left by an interrupted run
+        'progress_hooks': [progress_hook],
+        'outtmpl': outtmpl,
+        # Encoding runs later in the transcode pool (transcode_file) and the
+        # cover art comes from thumbnail_cache, so no postprocessor runs here
+    }
+    
+    # Add format options
+    profile = media_profile(format_type, profile)
+    if format_type == 'audio':
+        opts['format'] = 'bestaudio/best'
+    elif profile == 'remux':
+        opts.update({
+            'format': 'bestvideo+bestaudio/best',
+            # Streams are copied into MP4 when they fit it, MKV otherwise
+            'merge_output_format': 'mp4/mkv',
+        })
+        if metadata:
+            # mutagen can't tag MKV; the merge that's run anyway writes the tags
+            opts['postprocessor_args'] = {'merger+ffmpeg_o': [
+                arg for key, value in metadata.items() if value for arg in ('-metadata', f"{key}={value}")
+            ]}
+    else:
+        opts['format'] = 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]'
+    return opts
+
+def transcode_file(file_info, profile):
+    """Bring a downloaded audio stream into its profile's format and return the updated file info"""
+    if mp3_bitrate(profile):
+        codec, quality = 'mp3', mp3_bitrate(profile)
+    elif profile == 'native':
+        # AAC stays as it is; Opus is copied out of WebM into an Ogg file mutagen can tag
+        codec, quality = 'best', None
+    else:
+        return file_info
+    if not os.path.exists(file_info['filepath']):
+        return file_info
+    
+    filepath = file_info['filepath']
+    with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
+        extract_audio = FFmpegExtractAudioPP(ydl, preferredcodec=codec, preferredquality=quality)
+        leftovers, info = extract_audio.run({'filepath': filepath, 'ext': os.path.splitext(filepath)[1][1:]})
+    for leftover in leftovers:
+        try:
+            os.remove(leftover)
+        except OSError:
+            pass
+    
+    file_info['filepath'] = info['filepath']
+    file_info['filename'] = os.path.basename(info['filepath'])
+    file_info['size'] = os.path.getsize(info['filepath'])
+    return file_info
+
+def finish_downloaded_file(file_info, profile, cache_key=None):
+    """Encode and tag a downloaded file, cache it and return its file info"""
+    transcode_file(file_info, profile)
+    cover = file_info.pop('cover', None)  # Shared by thumbnail_cache, so it stays
+    if os.path.exists(file_info['filepath']):
+        # Tags and cover art go in with one write, whatever the container
+        update_tags(file_info['filepath'], file_info['title'], file_info['artist'], file_info['album'], cover)
+        file_info['size'] = os.path.getsize(file_info['filepath'])
+        if cache_key:
+            media_cache.put(cache_key, file_info)
+    return file_info
+
+def fetch_cached_file(download_id, cache_key, download_dir, playlist_index=None, playlist_total=None):
+    """File info of a video served from the media cache, or None on a miss"""
+    file_info = media_cache.get(cache_key, download_dir)
+    if file_info is not None:
+        starting = {
+            'status': 'starting',
+            'title': file_info['title'],
+            'artist': file_info['artist'],
+            'album': file_info['album'],
+            'cached': True
+        }
+        if playlist_index:
+            starting['playlist_index'] = playlist_index
+            starting['playlist_total'] = playlist_total
+        emit_progress(download_id, starting, percent=100.0)
+    return file_info
+
+def download_entry(download_id, video_info, format_type, download_dir, playlist_index=None, playlist_total=None, finish=True, profile=None):
+    """Download one video from its extracted info and return its file info"""
+    title, artist, album = get_track_metadata(video_info)
+    base_filename = build_base_filename(title, artist, album)
+    
+    download_opts = build_download_opts(
+        format_type,
+        create_progress_hook(download_id, playlist_index, playlist_total),
+        os.path.join(download_dir, f"{base_filename}.%(ext)s"),
+        profile,
+        {'title': title, 'artist': artist, 'album': album}
+    )
+    
+    starting = {
+        'status': 'starting',
+        'title': title,
+        'artist': artist,
+        'album': album
+    }
+    if playlist_index:
+        starting['playlist_index'] = playlist_index
+        starting['playlist_total'] = playlist_total
+    emit_progress(download_id, starting, percent=0.0)
+    
+    # Download from the extracted info instead of extracting again; this
+    # also continues any .part file left by a pause or crash
+    with yt_dlp.YoutubeDL(download_opts) as download_ydl:
+        result = download_ydl.process_ie_result(copy.deepcopy(video_info), download=True)
+    
+    # yt-dlp reports where the file ended up after postprocessing
+    requested = (result or {}).get('requested_downloads') or []
+    filepath = requested[-1].get('filepath') if requested else None
+    if not filepath:
+        ext = (result or {}).get('ext') or 'mp4'
+        filepath = os.path.join(download_dir, f"{base_filename}.{ext}")
+    filename = os.path.basename(filepath)
+    
+    file_info = {
+        'filename': filename,
+        'filepath': filepath,
+        'title': title,
+        'artist': artist,
+        'album': album,
+        'size': os.path.getsize(filepath) if os.path.exists(filepath) else 0
+    }
+    # Cover art for finish_downloaded_file to embed, fetched once per image
+    cover = thumbnail_cache.get(video_key_of(video_info), 'cover', thumbnail_source(video_info))
+    if cover:
+        file_info['cover'] = cover
+    if finish:
+        finish_downloaded_file(file_info, profile, media_cache_key(video_key_of(video_info), format_type, profile))
+    return file_info
+
+def download_video(url, format_type, download_id, playlist_limit=None, lookahead=PLAYLIST_LOOKAHEAD, parallelism=1, profile=None):
+    profile = media_profile(format_type, profile)
+    # A resumed download picks up the info and playlist position saved on pause
+    resume_state = paused_downloads.pop(download_id, None) or {}
+    
     try:
-        # Create queue for this download
-        if download_id not in progress_queues:
-            progress_queues[download_id] = queue.Queue()
-        progress_queue = progress_queues[download_id]
-        
-        # Initialize cancellation flag and activity tracking
+        # Initialize cancellation/pause flags and activity tracking
         download_cancelled[download_id] = False
+        download_paused[download_id] = False
         download_last_activity[download_id] = time.time()
         
         # Check if it's a playlist
         is_playlist = 'playlist' in url or 'list=' in url
         
-        # Always use temp directory for web hosting
-        download_dir = TEMP_DIR
+        # Always use temp directory for web hosting, one directory per job
+        download_dir = job_dir(download_id)
+        os.makedirs(download_dir, exist_ok=True)
         
-        # Base options for extraction only
-        extract_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': True if is_playlist else False,
-        }
+        # A video already in the media cache needs no yt-dlp at all
+        url_cache_key = None if is_playlist else media_cache_key(url_video_key(url), format_type, profile)
+        file_info = fetch_cached_file(download_id, url_cache_key, download_dir) if url_cache_key else None
         
-        # Extract info without downloading
-        with yt_dlp.YoutubeDL(extract_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
+        # Extract info without downloading; /preview has usually done it already
+        info = resume_state.get('info')
+        if info is None and file_info is None:
+            info = extract_info_cached(url, flat=is_playlist)
+            resume_state['info'] = info
+        
+        # Handle playlist
+        if info and 'entries' in info:
+            # It's a playlist
+            playlist_title = info.get('title', 'Unknown Playlist')
+            entries = info['entries'][:playlist_limit] if playlist_limit else info['entries']
+            total_videos = len(entries)
             
-            # Handle playlist
-            if 'entries' in info:
-                # It's a playlist
-                playlist_title = info.get('title', 'Unknown Playlist')
-                entries = info['entries'][:playlist_limit] if playlist_limit else info['entries']
-                total_videos = len(entries)
-                
-                progress_queue.put({
-                    'status': 'playlist_info',
-                    'playlist_title': playlist_title,
-                    'total_videos': total_videos
-                })
+            emit_progress(download_id, {
+                'status': 'playlist_info',
+                'playlist_title': playlist_title,
+                'total_videos': total_videos
+            }, playlist_total=total_videos)
+            
+            # Progress kept across a pause; entries can finish out of order
+            files = resume_state.setdefault('files', {})  # playlist index -> file info
+            finished = resume_state.setdefault('finished', set())  # indexes not to run again
+            entry_infos = resume_state.setdefault('entry_infos', {})  # full info of entries cut off mid-download
+            parallelism = max(1, min(parallelism, MAX_PLAYLIST_PARALLELISM))
+            
+            # The ZIP served for the playlist grows as entries complete
+            archive = resume_state.get('archive')
+            if archive is None:
+                archive = resume_state['archive'] = PlaylistArchive(os.path.join(download_dir, 'playlist.zip'))
+            
+            # Entries go through three stages: metadata for the next `lookahead`
+            # entries is extracted ahead, up to `parallelism` entries download at
+            # once, and encoding and tagging run behind the downloads in the shared
+            # transcode pool. Results are collected in playlist order.
+            prefetcher = ThreadPoolExecutor(max_workers=max(1, lookahead), thread_name_prefix=f"prefetch-{download_id[:8]}")
+            downloader = ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix=f"entry-{download_id[:8]}")
+            prefetched = {}  # playlist index -> future of the entry's full info
+            in_flight = deque()  # (playlist index, entry, future of file info), in playlist order
+            tagging = deque()  # (playlist index, future of file info), in playlist order
+            interrupted = False  # An entry was cut off by a pause
+            
+            def prefetch(first):
+                for i in range(first, min(first + lookahead, total_videos) + 1):
+                    if (i not in prefetched and i not in finished and i not in entry_infos
+                            and entries[i - 1] is not None
+                            and media_cache_key(video_key_of(entries[i - 1]), format_type, profile) not in media_cache):
+                        prefetched[i] = prefetcher.submit(extract_entry_info, entries[i - 1])
+            
+            def download_one(idx, info_future):
+                """Returns the entry's file info and its media cache key, None if it came from the cache"""
+                cache_key = media_cache_key(video_key_of(entries[idx - 1]), format_type, profile)
+                if cache_key:
+                    file_info = fetch_cached_file(download_id, cache_key, download_dir, idx, total_videos)
+                    if file_info is not None:
+                        return file_info, None
                 
-                downloaded_files = []
+                # Full metadata for this video (kept if paused mid-entry)
+                video_info = entry_infos.get(idx)
+                if video_info is None:
+                    video_info = info_future.result() if info_future else extract_entry_info(entries[idx - 1])
+                    entry_infos[idx] = video_info
                 
-                for idx, entry in enumerate(entries, 1):
-                    # Check for cancellation
-                    if download_cancelled.get(download_id, False):
-                        progress_queue.put({'status': 'cancelled', 'message': 'Download cancelled by user'})
-                        break
-                        
-                    if entry is None:
-                        continue
-                    
-                    # Initialize variables with defaults to prevent reference errors
-                    title = f"Unknown Video {idx}"
-                    artist = "Unknown Artist"
-                    album = ""
-                    
+                with entry_download_slots:
+                    file_info = download_entry(download_id, video_info, format_type, download_dir, idx, total_videos, finish=False, profile=profile)
+                entry_infos.pop(idx, None)
+                return file_info, media_cache_key(video_key_of(video_info), format_type, profile)
+            
+            def collect_downloaded(block=False):
+                nonlocal interrupted
+                while in_flight and (block or in_flight[0][2].done()):
+                    idx, entry, future = in_flight.popleft()
                     try:
-                        # Get the video URL
-                        video_url = entry.get('url') or entry.get('webpage_url') or f"https://www.youtube.com/watch?v={entry.get('id')}"
-                        
-                        # Create download options for this specific video
-                        video_ydl_opts = {
-                            'quiet': False,
-                            'no_warnings': False,
-                            'progress_hooks': [create_progress_hook(download_id, idx, total_videos)],
-                        }
-                        
-                        # Add format options
-                        if format_type == 'audio':
-                            video_ydl_opts.update({
-                                'format': 'bestaudio/best',
-                                'postprocessors': [{
-                                    'key': 'FFmpegExtractAudio',
-                                    'preferredcodec': 'mp3',
-                                }, {
-                                    'key': 'FFmpegMetadata',
-                                    'add_metadata': True,
-                                }, {
-                                    'key': 'EmbedThumbnail',
-                                    'already_have_thumbnail': False,
-                                }],
-                                'writethumbnail': True,  # Download thumbnail to embed as cover art
-                            })
-                        else:
-                            video_ydl_opts.update({
-                                'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]',
-                            })
-                        
-                        # First extract full metadata for this video
-                        with yt_dlp.YoutubeDL({'quiet': True}) as info_ydl:
-                            video_info = info_ydl.extract_info(video_url, download=False)
-                        
-                        # Get metadata
-                        title = video_info.get('title', 'Unknown')
-                        artist = video_info.get('artist', video_info.get('uploader', video_info.get('channel', '')))
-                        album = video_info.get('album', '')
-                        
-                        # Clean filename components
-                        def clean_filename(s):
-                            # Remove problematic characters but keep more valid ones
-                            return "".join(c for c in s if c.isalnum() or c in (' ', '-', '_', '.', '(', ')', '[', ']', ',')).strip()
-                        
-                        safe_title = clean_filename(title)
-                        safe_artist = clean_filename(artist) if artist else ''
-                        safe_album = clean_filename(album) if album else ''
-                        
-                        # Build filename based on available metadata
-                        if safe_artist and safe_album:
-                            base_filename = f"{safe_artist} - {safe_title} - {safe_album}"
-                        elif safe_artist:
-                            base_filename = f"{safe_artist} - {safe_title}"
-                        else:
-                            base_filename = safe_title
-                        
-                        # Set the output template
-                        video_ydl_opts['outtmpl'] = os.path.join(download_dir, f"{base_filename}.%(ext)s")
-                        
-                        progress_queue.put({
-                            'status': 'starting', 
-                            'title': title,
-                            'artist': artist,
-                            'album': album,
-                            'playlist_index': idx,
-                            'playlist_total': total_videos
-                        })
-                        
-                        # Download the video
-                        with yt_dlp.YoutubeDL(video_ydl_opts) as video_ydl:
-                            video_ydl.download([video_url])
-                        
-                        # Find the downloaded file
-                        ext = 'mp3' if format_type == 'audio' else 'mp4'
-                        expected_filename = f"{base_filename}.{ext}"
-                        expected_path = os.path.join(download_dir, expected_filename)
-                        
-                        if os.path.exists(expected_path):
-                            # Update ID3 tags if it's an MP3
-                            if format_type == 'audio':
-                                update_id3_tags(expected_path, title, artist, album)
-                            
-                            file_info = {
-                                'filename': expected_filename,
-                                'filepath': expected_path,
-                                'title': title,
-                                'artist': artist,
-                                'album': album,
-                                'size': os.path.getsize(expected_path)
-                            }
-                            downloaded_files.append(file_info)
-                            
-                            # Send file completed event
-                            progress_queue.put({
-                                'status': 'file_completed',
-                                'file_info': file_info,
-                                'playlist_index': idx,
-                                'playlist_total': total_videos
-                            })
-                        else:
-                            # Fallback: find the most recent file
-                            files = sorted(
-                                [f for f in os.listdir(download_dir) if f.endswith(f'.{ext}')],
-                                key=lambda x: os.path.getctime(os.path.join(download_dir, x)),
-                                reverse=True
-                            )
-                            if files:
-                                filename = files[0]
-                                filepath = os.path.join(download_dir, filename)
-                                
-                                # Update ID3 tags if it's an MP3
-                                if format_type == 'audio':
-                                    update_id3_tags(filepath, title, artist, album)
-                                
-                                file_info = {
-                                    'filename': filename,
-                                    'filepath': filepath,
-                                    'title': title,
-                                    'artist': artist,
-                                    'album': album,
-                                    'size': os.path.getsize(filepath)
-                                }
-                                downloaded_files.append(file_info)
-                                
-                                # Send file completed event
-                                progress_queue.put({
-                                    'status': 'file_completed',
-                                    'file_info': file_info,
-                                    'playlist_index': idx,
-                                    'playlist_total': total_videos
-                                })
-                                
+                        file_info, cache_key = future.result()
                     except Exception as e:
+                        # A pause stops the whole playlist, not just this entry
+                        if download_paused.get(download_id):
+                            interrupted = True
+                            continue
                         app.logger.error(f"Error downloading video {idx}/{total_videos}: {str(e)}")
                         # Get title from entry if available
-                        error_title = entry.get('title', title) if entry else title
-                        progress_queue.put({
+                        error_title = entry.get('title', f"Unknown Video {idx}")
+                        emit_progress(download_id, {
                             'status': 'error',
                             'message': f"Failed to download video {idx}: {error_title}. Error: {str(e)}",
                             'playlist_index': idx,
                             'playlist_total': total_videos
                         })
                         # Continue with next video instead of stopping
+                        finished.add(idx)
                         continue
-                
-                # Store all downloaded files info
-                completed_downloads[download_id] = {
-                    'is_playlist': True,
-                    'playlist_title': playlist_title,
-                    'files': downloaded_files,
-                    'format': format_type,
-                    'timestamp': datetime.now().isoformat(),
-                    'download_dir': download_dir
-                }
-                
-                progress_queue.put({
-                    'status': 'playlist_completed',
-                    'playlist_title': playlist_title,
-                    'download_id': download_id,
-                    'total_files': len(downloaded_files),
-                    'total_size': sum(f['size'] for f in downloaded_files)
-                })
-                
-            else:
-                # Single video download
-                # Create download options
-                download_opts = {
-                    'quiet': False,
-                    'no_warnings': False,
-                    'progress_hooks': [create_progress_hook(download_id)],
-                }
-                
-                # Add format options
-                if format_type == 'audio':
-                    download_opts.update({
-                        'format': 'bestaudio/best',
-                        'postprocessors': [{
-                            'key': 'FFmpegExtractAudio',
-                            'preferredcodec': 'mp3',
-                        }, {
-                            'key': 'FFmpegMetadata',
-                            'add_metadata': True,
-                        }, {
-                            'key': 'EmbedThumbnail',
-                            'already_have_thumbnail': False,
-                        }],
-                        'writethumbnail': True,  # Download thumbnail to embed as cover art
-                    })
-                else:
-                    download_opts.update({
-                        'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]',
+                    
+                    finished.add(idx)
+                    if cache_key is None:
+                        # Cached files are already tagged; queue them to keep the order
+                        tagged = Future()
+                        tagged.set_result(file_info)
+                        tagging.append((idx, tagged))
+                    elif os.path.exists(file_info['filepath']):
+                        tagging.append((idx, transcode_pool.submit(finish_downloaded_file, file_info, profile, cache_key)))
+            
+            def collect_tagged(block=False):
+                while tagging and (block or tagging[0][1].done()):
+                    i, future = tagging.popleft()
+                    try:
+                        file_info = future.result()
+                    except Exception as e:
+                        app.logger.error(f"Error processing video {i}/{total_videos}: {str(e)}")
+                        emit_progress(download_id, {
+                            'status': 'error',
+                            'message': f"Failed to process video {i}: {describe_download_error(e)}",
+                            'playlist_index': i,
+                            'playlist_total': total_videos
+                        })
+                        continue
+                    files[i] = file_info
+                    archive.add(file_info['filepath'], file_info['filename'])
+                    
+                    # Send file completed event
+                    emit_progress(download_id, {
+                        'status': 'file_completed',
+                        'file_info': file_info,
+                        'playlist_index': i,
+                        'playlist_total': total_videos
                     })
-                
-                # Extract full info first
-                with yt_dlp.YoutubeDL({'quiet': True}) as info_ydl:
-                    video_info = info_ydl.extract_info(url, download=False)
-                
-                # Get metadata
-                title = video_info.get('title', 'Unknown')
-                artist = video_info.get('artist', video_info.get('uploader', video_info.get('channel', '')))
-                album = video_info.get('album', '')
-                
-                # Clean filename components
-                def clean_filename(s):
-                    # Remove problematic characters but keep more valid ones
-                    return "".join(c for c in s if c.isalnum() or c in (' ', '-', '_', '.', '(', ')', '[', ']', ',')).strip()
-                
-                safe_title = clean_filename(title)
-                safe_artist = clean_filename(artist) if artist else ''
-                safe_album = clean_filename(album) if album else ''
-                
-                # Build filename based on available metadata
-                if safe_artist and safe_album:
-                    base_filename = f"{safe_artist} - {safe_title} - {safe_album}"
-                elif safe_artist:
-                    base_filename = f"{safe_artist} - {safe_title}"
-                else:
-                    base_filename = safe_title
-                
-                # Set the output template
-                download_opts['outtmpl'] = os.path.join(download_dir, f"{base_filename}.%(ext)s")
-                
-                progress_queue.put({
-                    'status': 'starting', 
-                    'title': title,
-                    'artist': artist,
-                    'album': album
-                })
-                
-                # Download the file
-                with yt_dlp.YoutubeDL(download_opts) as download_ydl:
-                    download_ydl.download([url])
-                
-                # Find the downloaded file
-                ext = 'mp3' if format_type == 'audio' else 'mp4'
-                expected_filename = f"{base_filename}.{ext}"
-                filepath = os.path.join(download_dir, expected_filename)
-                
-                if not os.path.exists(filepath):
-                    # Fallback: find the most recently created file
-                    files = sorted(
-                        [f for f in os.listdir(download_dir) if f.endswith(f'.{ext}')],
-                        key=lambda x: os.path.getctime(os.path.join(download_dir, x)),
-                        reverse=True
-                    )
-                    if files:
-                        expected_filename = files[0]
-                        filepath = os.path.join(download_dir, expected_filename)
-                
-                # Update ID3 tags if it's an MP3
-                if format_type == 'audio' and os.path.exists(filepath):
-                    update_id3_tags(filepath, title, artist, album)
-                
-                # Store download info
-                completed_downloads[download_id] = {
-                    'filename': expected_filename,
-                    'filepath': filepath,
-                    'title': title,
-                    'artist': artist,
-                    'album': album,
-                    'format': format_type,
-                    'timestamp': datetime.now().isoformat(),
-                    'size': os.path.getsize(filepath) if os.path.exists(filepath) else 0,
-                    'download_dir': download_dir
-                }
-                
-                progress_queue.put({
-                    'status': 'completed', 
-                    'title': title,
-                    'artist': artist,
-                    'album': album,
-                    'download_id': download_id,
-                    'filename': expected_filename,
-                    'size': completed_downloads[download_id]['size']
-                })
             
+            try:
+                for idx, entry in enumerate(entries, 1):
+                    # Skip entries finished before a pause
+                    if idx in finished or entry is None:
+                        continue
+                    
+                    # Check for cancellation
+                    if download_cancelled.get(download_id, False):
+                        emit_progress(download_id, {'status': 'cancelled', 'message': 'Download cancelled by user'})
+                        break
+                    if download_paused.get(download_id):
+                        raise DownloadPaused("Download paused by user")
+                    
+                    # Wait until fewer than `parallelism` entries of this job are downloading
+                    while True:
+                        running = [future for _, _, future in in_flight if not future.done()]
+                        if len(running) < parallelism:
+                            break
+                        wait(running, return_when=FIRST_COMPLETED)
+                    collect_downloaded()
+                    collect_tagged()
+                    
+                    prefetch(idx)
+                    in_flight.append((idx, entry, downloader.submit(download_one, idx, prefetched.pop(idx, None))))
+            finally:
+                # Files downloaded before a pause or cancel still count
+                collect_downloaded(block=True)
+                collect_tagged(block=True)
+                prefetcher.shutdown(wait=False, cancel_futures=True)
+                downloader.shutdown(wait=False)
+            
+            if interrupted:
+                raise DownloadPaused("Download paused by user")
+            
+            downloaded_files = [files[i] for i in sorted(files)]
+            
+            # Store all downloaded files info
+            completed_downloads[download_id] = {
+                'is_playlist': True,
+                'playlist_title': playlist_title,
+                'files': downloaded_files,
+                'format': format_type,
+                'profile': profile,
+                'timestamp': datetime.now().isoformat(),
+                'download_dir': download_dir,
+                'archive': archive.finish()  # Only the last entry's append is left to wait for
+            }
+            
+            emit_progress(download_id, {
+                'status': 'playlist_completed',
+                'playlist_title': playlist_title,
+                'download_id': download_id,
+                'total_files': len(downloaded_files),
+                'total_size': sum(f['size'] for f in downloaded_files)
+            })
+            
+        else:
+            # Single video download; the info above is already the full extraction
+            if file_info is None:
+                cache_key = media_cache_key(video_key_of(info), format_type, profile)
+                if cache_key and cache_key != url_cache_key:
+                    file_info = fetch_cached_file(download_id, cache_key, download_dir)
+            if file_info is None:
+                file_info = download_entry(download_id, info, format_type, download_dir, finish=False, profile=profile)
+                # Encoding no longer needs the network; the queue frees this
+                # job's download slot while the returned future runs
+                return transcode_pool.submit(complete_single_download, download_id, file_info, format_type, profile, download_dir, True, cache_key)
+            
+            complete_single_download(download_id, file_info, format_type, profile, download_dir)
+        
+        return completed_downloads[download_id]
+        
     except Exception as e:
+        if download_paused.get(download_id):
+            # Keep partial files and extracted info so resume continues from here
+            paused_downloads[download_id] = resume_state
+            emit_progress(download_id, {'status': 'paused', 'message': 'Download paused'})
+            raise DownloadPaused("Download paused by user") from e
+        
         # Clean up any partial downloads
+        if resume_state.get('archive'):
+            resume_state['archive'].abort()
+        raise download_failed(download_id, e) from e
+
+def complete_single_download(download_id, file_info, format_type, profile, download_dir, finish=False, cache_key=None):
+    """Record a completed single video, encoding and tagging it first if it was just downloaded"""
+    if finish:
         try:
-            import glob
-            pattern = os.path.join(TEMP_DIR, f"*{download_id}*")
-            for file in glob.glob(pattern):
-                try:
-                    os.remove(file)
-                    app.logger.info(f"Cleaned up partial download: {file}")
-                except:
-                    pass
-        except:
-            pass
-            
-        # Send more detailed error message
-        error_msg = str(e)
-        if 'Connection reset by peer' in error_msg:
-            error_msg = "Network connection lost. Please check your internet connection and try again."
-        elif 'HTTP Error 403' in error_msg:
-            error_msg = "Access denied. The video may be private, age-restricted, or region-blocked."
-        elif 'Video unavailable' in error_msg:
-            error_msg = "Video is unavailable. It may have been removed or made private."
-        elif 'ffmpeg' in error_msg.lower() or 'FFmpeg' in error_msg:
-            error_msg = "FFmpeg error. Please ensure FFmpeg is installed for audio downloads."
-            
-        progress_queue.put({'status': 'error', 'message': error_msg})
+            finish_downloaded_file(file_info, profile, cache_key)
+        except Exception as e:
+            raise download_failed(download_id, e) from e
+    
+    # Store download info
+    completed_downloads[download_id] = dict(
+        file_info,
+        format=format_type,
+        profile=profile,
+        timestamp=datetime.now().isoformat(),
+        download_dir=download_dir
+    )
+    
+    emit_progress(download_id, {
+        'status': 'completed', 
+        'title': file_info['title'],
+        'artist': file_info['artist'],
+        'album': file_info['album'],
+        'download_id': download_id,
+        'filename': file_info['filename'],
+        'size': file_info['size']
+    })
+    return completed_downloads[download_id]
+
+def describe_download_error(error):
+    """User-facing message for a failed download"""
+    error_msg = str(error)
+    if 'Connection reset by peer' in error_msg:
+        error_msg = "Network connection lost. Please check your internet connection and try again."
+    elif 'HTTP Error 403' in error_msg:
+        error_msg = "Access denied. The video may be private, age-restricted, or region-blocked."
+    elif 'Video unavailable' in error_msg:
+        error_msg = "Video is unavailable. It may have been removed or made private."
+    elif 'ffmpeg' in error_msg.lower() or 'FFmpeg' in error_msg:
+        error_msg = "FFmpeg error. Please ensure FFmpeg is installed for audio downloads."
+    return error_msg
+
+def download_failed(download_id, error):
+    """Remove a failed download's files, report it and return the error for the queue manager"""
+    remove_job_dir(download_id)
+    error_msg = describe_download_error(error)
+    emit_progress(download_id, {'status': 'error', 'message': error_msg})
+    return Exception(error_msg)
 
 @app.route('/')
 def index():
@@ -980,78 +2509,138 @@ def preview():
         data = request.json
         url = data.get('url', '').strip()
         page = data.get('page', 1)
-        per_page = 10  # Show 10 items per page
+        per_page = PREVIEW_PAGE_SIZE
         playlist_limit = data.get('playlist_limit', None)
+        if not (playlist_limit and isinstance(playlist_limit, int)):
+            playlist_limit = None
         
         if not url.startswith(('http://', 'https://')):
             return jsonify({'error': 'Invalid URL'}), 400
         
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': True,  # Don't download, just extract info
-        }
+        if not isinstance(page, int) or isinstance(page, bool) or page < 1:
+            return jsonify({'error': 'Page must be a positive integer.'}), 400
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
+        # Only the requested page is fetched, plus one entry to tell whether
+        # another page follows; pages are cached per playlist
+        start_idx = (page - 1) * per_page
+        info, page_entries, total_videos = extract_preview_page(url, start_idx + 1, per_page + 1)
+        
+        # Check if it's a playlist; an empty page is still one
+        if page_entries is not None:
+            has_more = len(page_entries) > per_page
+            page_entries = page_entries[:per_page]
             
-            # Check if it's a playlist
-            if 'entries' in info and info['entries']:
-                # It's a playlist
-                all_entries = info['entries']
-                total_videos = len(all_entries)
-                
-                # If playlist_limit is set, only show entries that will be downloaded
-                if playlist_limit and isinstance(playlist_limit, int):
-                    all_entries = all_entries[:playlist_limit]
-                    download_count = min(playlist_limit, total_videos)
-                else:
-                    download_count = total_videos
-                
-                # Calculate pagination
-                start_idx = (page - 1) * per_page
-                end_idx = start_idx + per_page
-                page_entries = all_entries[start_idx:end_idx]
-                
-                entries_info = []
-                for i, entry in enumerate(page_entries):
-                    if entry:
-                        entries_info.append({
-                            'index': start_idx + i + 1,
-                            'title': entry.get('title', 'Unknown'),
-                            'duration': entry.get('duration', 0),
-                            'uploader': entry.get('uploader', 'Unknown')
-                        })
-                
-                total_pages = (len(all_entries) + per_page - 1) // per_page
-                
-                return jsonify({
-                    'type': 'playlist',
-                    'title': info.get('title', 'Unknown Playlist'),
-                    'total_videos': total_videos,
-                    'download_count': download_count,
-                    'entries': entries_info,
-                    'page': page,
-                    'total_pages': total_pages,
-                    'has_next': page < total_pages,
-                    'has_prev': page > 1
-                })
+            # If playlist_limit is set, only show entries that will be downloaded
+            if playlist_limit:
+                page_entries = page_entries[:max(0, playlist_limit - start_idx)]
+                has_more = has_more and start_idx + per_page < playlist_limit
+            
+            # Only the first page of an empty playlist may be empty
+            if not page_entries and page > 1:
+                return jsonify({'error': 'Page out of range'}), 400
+            
+            entries_info = []
+            for i, entry in enumerate(page_entries):
+                if entry:
+                    entries_info.append({
+                        'index': start_idx + i + 1,
+                        'title': entry.get('title', 'Unknown'),
+                        'duration': entry.get('duration', 0),
+                        'uploader': entry.get('uploader', 'Unknown'),
+                        'thumbnail': preview_thumbnail(entry)
+                    })
+            
+            result = {
+                'type': 'playlist',
+                'title': info.get('title', 'Unknown Playlist'),
+                'entries': entries_info,
+                'page': page,
+                'has_prev': page > 1
+            }
+            if total_videos is not None:
+                result.update(playlist_page_counts(total_videos, playlist_limit, per_page))
+                result['has_next'] = page < result['total_pages']
             else:
-                # Single video
-                return jsonify({
-                    'type': 'video',
-                    'title': info.get('title', 'Unknown'),
-                    'artist': info.get('artist', info.get('uploader', 'Unknown')),
-                    'album': info.get('album', ''),
-                    'duration': info.get('duration', 0),
-                    'thumbnail': info.get('thumbnail', ''),
-                    'upload_date': info.get('upload_date', '')
+                # Counting a large playlist takes a while: the client gets the
+                # total from /preview/count when it's done
+                start_playlist_count(url)
+                result.update({
+                    'total_videos': None,
+                    'download_count': None,
+                    'total_pages': None,
+                    'has_next': has_more,
+                    'count_pending': True
                 })
-                
+            return jsonify(result)
+        else:
+            # Single video
+            return jsonify({
+                'type': 'video',
+                'title': info.get('title', 'Unknown'),
+                'artist': info.get('artist', info.get('uploader', 'Unknown')),
+                'album': info.get('album', ''),
+                'duration': info.get('duration', 0),
+                'thumbnail': preview_thumbnail(info),
+                'upload_date': info.get('upload_date', '')
+            })
+            
     except Exception as e:
         app.logger.error(f"Preview error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def preview_thumbnail(info):
+    """URL of a preview-sized thumbnail served by /thumb, or of the original if the video can't be keyed"""
+    video_key = video_key_of(info)
+    source = thumbnail_source(info)
+    thumbnail_cache.remember(video_key, source)
+    if not video_key or not thumbnail_cache.source_of(video_key):
+        return source or ''
+    return f"/thumb/{quote(video_key, safe='')}?size=preview"
+
+@app.route('/thumb/<video_key>')
+def thumbnail(video_key):
+    """A video's thumbnail, resized and cached locally"""
+    size = request.args.get('size', 'preview')
+    if size not in THUMBNAIL_SIZES:
+        return jsonify({'error': f"Size must be one of: {', '.join(THUMBNAIL_SIZES)}."}), 400
+    
+    path = thumbnail_cache.get(video_key, size)
+    if path is None:
+        return jsonify({'error': 'Thumbnail not available'}), 404
+    return send_file(path, mimetype='image/jpeg', conditional=True, etag=file_etag(path), max_age=86400)
+
+@app.route('/preview/count')
+def preview_count():
+    """Stream a playlist's total entry count once it has been counted"""
+    url = request.args.get('url', '').strip()
+    playlist_limit = request.args.get('playlist_limit', type=int)
+    
+    if not url.startswith(('http://', 'https://')):
+        return jsonify({'error': 'Invalid URL'}), 400
+    
+    job = start_playlist_count(url)
+    
+    def generate():
+        # Heartbeats keep the connection open while a long playlist is enumerated
+        while not job['done'].wait(15):
+            yield ": heartbeat\n\n"
+        
+        if job['error']:
+            data = {'error': job['error']}
+        else:
+            data = playlist_page_counts(job['total'], playlist_limit, PREVIEW_PAGE_SIZE)
+            if job['capped']:
+                # total_videos is a lower bound; the rest are only exact under a limit within it
+                data['capped'] = True
+                if not (playlist_limit and playlist_limit <= job['total']):
+                    data.update(download_count=None, total_pages=None)
+        yield f"event: count\ndata: {json.dumps(data)}\n\n"
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Disable Nginx buffering
+    return response
+
 @app.route('/download', methods=['POST'])
 def download():
     try:
@@ -1061,17 +2650,40 @@ def download():
         url = data.get('url', '').strip()
         format_type = data.get('format', 'video')
         playlist_limit = data.get('playlist_limit', None)  # Default to None (unlimited)
+        priority = data.get('priority', 0)  # Higher priority starts first
+        parallelism = data.get('parallelism', 1)  # Playlist entries downloaded at once
+        profile = data.get('profile')  # See FORMAT_PROFILES; None picks the format's default
+        bitrate = data.get('bitrate')  # kbps, for the mp3 profile
         
         # Validate URL
         if not url.startswith(('http://', 'https://')):
             app.logger.error(f"Invalid URL: {url}")
             return jsonify({'error': 'Invalid URL. Please enter a valid YouTube URL.'}), 400
         
+        if not isinstance(priority, int) or isinstance(priority, bool):
+            return jsonify({'error': 'Priority must be an integer.'}), 400
+        
+        if not isinstance(parallelism, int) or isinstance(parallelism, bool) or not 1 <= parallelism <= MAX_PLAYLIST_PARALLELISM:
+            return jsonify({'error': f'Parallelism must be an integer from 1 to {MAX_PLAYLIST_PARALLELISM}.'}), 400
+        
+        profiles = FORMAT_PROFILES['audio' if format_type == 'audio' else 'video']
+        if profile is not None and profile not in profiles:
+            return jsonify({'error': f"Profile must be one of: {', '.join(profiles)}."}), 400
+        
+        if bitrate is not None:
+            if format_type != 'audio' or profile not in (None, 'mp3'):
+                return jsonify({'error': 'Bitrate only applies to the mp3 profile.'}), 400
+            if not isinstance(bitrate, int) or isinstance(bitrate, bool) or bitrate not in MP3_BITRATES:
+                return jsonify({'error': f"Bitrate must be one of: {', '.join(map(str, MP3_BITRATES))} kbps."}), 400
+        
         # Add to queue without directory parameter
         download_id = download_queue.add_to_queue({
             'url': url,
             'format': format_type,
-            'playlist_limit': playlist_limit
+            'playlist_limit': playlist_limit,
+            'priority': priority,
+            'parallelism': parallelism,
+            'profile': media_profile(format_type, profile, bitrate)
         })
         
         app.logger.info(f"Download added to queue for URL: {url}")
@@ -1085,44 +2697,148 @@ def download():
 def progress(download_id):
     app.logger.info(f"Progress endpoint connected for download: {download_id}")
     
-    # Get or create queue for this download
-    if download_id not in progress_queues:
-        progress_queues[download_id] = queue.Queue()
-    progress_queue = progress_queues[download_id]
+    # Reconnecting clients send the id of the last event they saw
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0)
+    except ValueError:
+        last_event_id = 0
+    
+    channel = progress_bus.channel(download_id)
+    download_last_activity.setdefault(download_id, time.time())
+    subscriber = channel.subscribe(last_event_id)
     
     def generate():
-        while True:
-            try:
+        try:
+            while True:
                 # Get progress update with shorter timeout for more responsive heartbeats
-                progress_data = progress_queue.get(timeout=5)
-                yield f"data: {json.dumps(progress_data)}\n\n"
+                event = subscriber.get(timeout=5)
+                if event is None:
+                    # Send heartbeat to keep connection alive
+                    yield f"data: {json.dumps({'status': 'heartbeat'})}\n\n"
+                    continue
+                
+                seq, progress_data = event
+                yield f"id: {seq}\ndata: {json.dumps(progress_data)}\n\n"
                 
                 # If download is completed, errored, cancelled, or playlist completed, stop streaming
-                if progress_data.get('status') in ['completed', 'error', 'cancelled', 'playlist_completed']:
-                    # Clean up queue after completion
-                    if download_id in progress_queues:
-                        del progress_queues[download_id]
+                if is_terminal_event(progress_data):
                     # Clean up cancellation flag
                     if download_id in download_cancelled:
                         del download_cancelled[download_id]
                     break
-                # Don't break on file_completed, just pass it through
-                    
-            except queue.Empty:
-                # Send heartbeat to keep connection alive
-                yield f"data: {json.dumps({'status': 'heartbeat'})}\n\n"
-            except Exception as e:
-                yield f"data: {json.dumps({'status': 'error', 'message': str(e)})}\n\n"
-                # Clean up queue on error
-                if download_id in progress_queues:
-                    del progress_queues[download_id]
-                break
+                # Don't break on file_completed or a failed playlist entry, just pass it through
+        except Exception as e:
+            yield f"data: {json.dumps({'status': 'error', 'message': str(e)})}\n\n"
+        finally:
+            channel.unsubscribe(subscriber)
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Disable Nginx buffering
+    return response
+
+@app.route('/events')
+def queue_event_stream():
+    """Stream changes to every download in the queue over one connection"""
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0)
+    except ValueError:
+        last_event_id = 0
+    
+    snapshot, subscriber = download_queue.subscribe_events(last_event_id)
+    
+    def generate():
+        try:
+            # Tell the browser to wait a little before reconnecting
+            yield "retry: 2000\n\n"
+            if snapshot:
+                seq, state = snapshot
+                yield f"id: {seq}\ndata: {json.dumps(state)}\n\n"
+            
+            while True:
+                event = subscriber.get(timeout=15)
+                if event is None:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ": heartbeat\n\n"
+                    continue
+                seq, queue_event = event
+                yield f"id: {seq}\ndata: {json.dumps(queue_event)}\n\n"
+        finally:
+            queue_events.unsubscribe(subscriber)
     
     response = Response(stream_with_context(generate()), mimetype='text/event-stream')
     response.headers['Cache-Control'] = 'no-cache'
     response.headers['X-Accel-Buffering'] = 'no'  # Disable Nginx buffering
     return response
 
+class TransferWatch:
+    """Response body that reports whether it was sent to the end"""
+    
+    def __init__(self, iterable, on_complete):
+        self.iterable = iterable
+        self.on_complete = on_complete
+        self.complete = False
+    
+    def __iter__(self):
+        yield from self.iterable
+        self.complete = True
+    
+    def close(self):
+        if hasattr(self.iterable, 'close'):
+            self.iterable.close()
+        if self.complete:
+            self.on_complete()
+
+def file_etag(filepath):
+    """ETag that stays the same for as long as the file is unchanged"""
+    stat = os.stat(filepath)
+    return f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+def media_mimetype(filename):
+    """Content-Type of a downloaded file, from its extension (profiles produce MP3, M4A, Opus, MP4 or MKV)"""
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+def served_by_file_wrapper(response):
+    """Whether the server's wsgi.file_wrapper sends the response body rather than werkzeug"""
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    if file_wrapper is None:
+        return False
+    if isinstance(file_wrapper, type):
+        return isinstance(response.response, file_wrapper)
+    # PEP 3333 only asks for a callable (uWSGI's is a builtin function): a
+    # body that isn't werkzeug's own file or range wrapper came from it
+    return not isinstance(response.response, (FileWrapper, _RangeWrapper))
+
+def send_job_file(download_id, filepath, download_name, mimetype):
+    """Send a download's file with Range and conditional GET support; it's removed once delivered"""
+    hold_served_files(download_id)
+    
+    # send_file answers If-None-Match/If-Range with 304 and Range with 206
+    response = send_file(
+        filepath,
+        as_attachment=True,
+        download_name=download_name,
+        mimetype=mimetype,
+        conditional=True,
+        etag=file_etag(filepath)
+    )
+    
+    # Servers with a wsgi.file_wrapper (gunicorn, uWSGI) send whole files with
+    # sendfile(), and X-Sendfile hands them to the front server. Neither shows
+    # when the transfer ends, so those files wait for the grace period.
+    if app.config['USE_X_SENDFILE'] or served_by_file_wrapper(response):
+        return response
+    
+    # Only the whole file completes the transfer: a 200, or a 206 covering
+    # every byte. Other ranges (e.g. a tail-only bytes=-N) wait for the
+    # grace period, since the client may still be fetching the rest.
+    content_range = response.content_range
+    if response.status_code == 200 or (
+            response.status_code == 206 and content_range and content_range.start == 0
+            and content_range.stop == content_range.length):
+        response.response = TransferWatch(response.response, lambda: release_served_files(download_id))
+    return response
+
 @app.route('/download/<download_id>')
 def download_file(download_id):
     """Serve the downloaded file(s) to trigger browser download"""
@@ -1163,7 +2879,9 @@ def download_single_file(download_id, file_index):
             filepath,
             as_attachment=True,
             download_name=filename,
-            mimetype='audio/mpeg' if download_info['format'] == 'audio' else 'video/mp4'
+            mimetype=media_mimetype(filename),
+            conditional=True,
+            etag=file_etag(filepath)
         )
     
     # Handle single file (file_index should be 0)
@@ -1175,24 +2893,125 @@ def download_single_file(download_id, file_index):
     if not os.path.exists(filepath):
         return jsonify({'error': 'File not found'}), 404
     
-    # Clean up single files after sending
-    @after_this_request
-    def cleanup(response):
+    return send_job_file(
+        download_id,
+        filepath,
+        download_info['filename'],
+        media_mimetype(download_info['filename'])
+    )
+
+# Playlist archives are streamed: a chunk read from disk is sent before the next one is read
+ZIP_CHUNK_SIZE = 1024 * 1024
+# Already compressed; deflating these costs CPU and saves nothing
+STORED_EXTENSIONS = ('.mp3', '.mp4', '.m4a', '.webm', '.opus', '.ogg', '.mkv', '.jpg', '.jpeg', '.png', '.webp')
+
+class ZipStreamBuffer:
+    """Unseekable file object that collects zipfile output for a streaming response"""
+    
+    def __init__(self):
+        self.chunks = deque()
+        self.position = 0
+    
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+    
+    def tell(self):
+        return self.position
+    
+    def flush(self):
+        pass
+    
+    def drain(self):
+        while self.chunks:
+            yield self.chunks.popleft()
+
+def stream_zip(files):
+    """Yield a ZIP of (path, name in archive) pairs chunk by chunk, in constant memory"""
+    buffer = ZipStreamBuffer()
+    # Without seek(), zipfile writes sizes and CRCs after each entry's data
+    with zipfile.ZipFile(buffer, 'w') as zipf:
+        for filepath, arcname in files:
+            zinfo = zipfile.ZipInfo.from_file(filepath, arcname)
+            if filepath.lower().endswith(STORED_EXTENSIONS):
+                zinfo.compress_type = zipfile.ZIP_STORED
+            else:
+                zinfo.compress_type = zipfile.ZIP_DEFLATED
+            
+            with open(filepath, 'rb') as source, zipf.open(zinfo, 'w') as dest:
+                while True:
+                    chunk = source.read(ZIP_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    yield from buffer.drain()
+            yield from buffer.drain()
+    # Central directory
+    yield from buffer.drain()
+
+class PlaylistArchive:
+    """A playlist's ZIP, appended to on a background thread as entries complete"""
+    
+    def __init__(self, path):
+        self.path = path
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='archive')
+        self.zipf = None
+        self.failed = False
+    
+    def add(self, filepath, arcname):
+        self.writer.submit(self._append, filepath, arcname)
+    
+    def _append(self, filepath, arcname):
+        if self.failed:
+            return
+        try:
+            if self.zipf is None:
+                self.zipf = zipfile.ZipFile(self.path + '.part', 'w')
+            if filepath.lower().endswith(STORED_EXTENSIONS):
+                compress_type = zipfile.ZIP_STORED
+            else:
+                compress_type = zipfile.ZIP_DEFLATED
+            self.zipf.write(filepath, arcname, compress_type=compress_type)
+        except Exception as e:
+            app.logger.error(f"Error adding {arcname} to {self.path}: {e}")
+            self.failed = True
+    
+    def finish(self):
+        """Wait for pending appends and close the archive; returns its path, or None if there is none"""
+        self.writer.submit(self._close).result()
+        self.writer.shutdown()
+        return self.path if os.path.exists(self.path) else None
+    
+    def _close(self):
+        if self.zipf is None:
+            return
         try:
-            os.remove(filepath)
+            self.zipf.close()
+            if not self.failed:
+                os.replace(self.path + '.part', self.path)
         except Exception as e:
-            app.logger.error(f"Error cleaning up file: {e}")
-        return response
+            app.logger.error(f"Error closing {self.path}: {e}")
+        self.zipf = None
     
-    return send_file(
-        filepath,
-        as_attachment=True,
-        download_name=download_info['filename'],
-        mimetype='audio/mpeg' if download_info['format'] == 'audio' else 'video/mp4'
-    )
+    def abort(self):
+        """Stop appending; the job's directory cleanup removes the partial file"""
+        self.failed = True
+        self.writer.submit(self._close)
+        self.writer.shutdown(wait=False, cancel_futures=True)
+
+def attachment_headers(response, filename):
+    """Set Content-Disposition like send_file does, with an RFC 5987 name for non-ASCII titles"""
+    try:
+        filename.encode('ascii')
+        names = {'filename': filename}
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+        names = {'filename': simple, 'filename*': f"UTF-8''{quote(filename, safe='!#$&+-.^_`|~')}"}
+    response.headers.set('Content-Disposition', 'attachment', **names)
 
 def download_playlist_zip(download_id):
-    """Create and serve a ZIP file containing all playlist files"""
+    """Serve a ZIP file containing all playlist files"""
     if download_id not in completed_downloads:
         return jsonify({'error': 'Download not found'}), 404
     
@@ -1201,35 +3020,26 @@ def download_playlist_zip(download_id):
     if not download_info.get('is_playlist'):
         return jsonify({'error': 'Not a playlist download'}), 404
     
-    # Create a ZIP file containing all downloaded files
     zip_filename = f"{download_info['playlist_title'].replace(' ', '_')}.zip"
-    zip_path = os.path.join(TEMP_DIR, zip_filename)
     
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for file_info in download_info['files']:
-            if os.path.exists(file_info['filepath']):
-                # Add file to zip with just the filename (not full path)
-                zipf.write(file_info['filepath'], file_info['filename'])
+    # Normally the archive was assembled while the playlist downloaded
+    archive_path = download_info.get('archive')
+    if archive_path and os.path.exists(archive_path):
+        return send_job_file(download_id, archive_path, zip_filename, 'application/zip')
     
-    # Clean up after sending
-    @after_this_request
-    def cleanup(response):
-        try:
-            os.remove(zip_path)
-            # Also clean up the individual files
-            for file_info in download_info['files']:
-                if os.path.exists(file_info['filepath']):
-                    os.remove(file_info['filepath'])
-        except Exception as e:
-            app.logger.error(f"Error cleaning up files: {e}")
-        return response
+    files = [(file_info['filepath'], file_info['filename'])
+             for file_info in download_info['files'] if os.path.exists(file_info['filepath'])]
     
-    return send_file(
-        zip_path,
-        as_attachment=True,
-        download_name=zip_filename,
-        mimetype='application/zip'
-    )
+    def generate():
+        # No prebuilt archive: build it while it's sent, without writing it to disk
+        yield from stream_zip(files)
+        # Clean up once the whole archive has gone out
+        remove_job_dir(download_id)
+    
+    response = Response(stream_with_context(generate()), mimetype='application/zip')
+    attachment_headers(response, zip_filename)
+    response.headers['X-Accel-Buffering'] = 'no'  # Disable Nginx buffering
+    return response
 
 @app.route('/download/info/<download_id>')
 def get_download_info(download_id):
@@ -1275,13 +3085,15 @@ def get_download_info(download_id):
 def cancel_download(download_id):
     """Cancel an ongoing download"""
     try:
+        # Requests sharing the job keep it; this one just stops following it
+        if download_queue.cancel_download(download_id) == 'detached':
+            return jsonify({'message': 'Download continues for other requests', 'detached': True}), 200
         if download_id in download_cancelled:
             download_cancelled[download_id] = True
             app.logger.info(f"Download cancelled: {download_id}")
             
             # Send cancellation message to progress queue
-            if download_id in progress_queues:
-                progress_queues[download_id].put({'status': 'cancelled', 'message': 'Download cancelled by user'})
+            emit_progress(download_id, {'status': 'cancelled', 'message': 'Download cancelled by user'})
             
             return jsonify({'message': 'Download cancelled successfully'}), 200
         else:
@@ -1308,14 +3120,49 @@ def check_ffmpeg():
     
     return jsonify({'has_ffmpeg': has_ffmpeg, 'message': message})
 
+@app.route('/stats')
+def stats():
+    """Runtime counters"""
+    with progress_stats_lock:
+        progress_events = {
+            'emitted': progress_stats['emitted'],
+            'suppressed': progress_stats['suppressed'],
+            'max_per_second': PROGRESS_UPDATES_PER_SECOND,
+            'downloads': {
+                download_id: {'emitted': emitted, 'suppressed': suppressed}
+                for download_id, (_, emitted, suppressed) in progress_throttle.items()
+            }
+        }
+    return jsonify({
+        'progress_events': progress_events,
+        'info_cache': info_cache.stats(),
+        'media_cache': media_cache.stats(),
+        'thumbnail_cache': thumbnail_cache.stats(),
+        'pools': {
+            'download': download_queue.pool_stats(),
+            'transcode': transcode_pool.stats()
+        }
+    })
+
 @app.route('/queue/status')
 def queue_status():
-    """Get current queue status"""
-    return jsonify(download_queue.get_queue_status())
+    """Get current queue status; ?since=<version> returns only what changed"""
+    # Nothing changed since the client's copy: answer without touching the queue
+    if request.if_none_match.contains(f"v{download_queue.version}"):
+        response = Response(status=304)
+        response.set_etag(f"v{download_queue.version}")
+        return response
+    
+    status = download_queue.get_queue_status(request.args.get('since', type=int))
+    response = jsonify(status)
+    response.set_etag(f"v{status['version']}")
+    return response
 
 @app.route('/queue/pause/<download_id>', methods=['POST'])
 def pause_download_queue(download_id):
     """Pause a download"""
+    if download_queue.shared_by_others(download_id):
+        return jsonify({'error': 'Download is shared with other requests and cannot be paused'}), 409
     success = download_queue.pause_download(download_id)
     if success:
         return jsonify({'message': 'Download paused', 'download_id': download_id})
@@ -1334,12 +3181,49 @@ def resume_download_queue(download_id):
 @app.route('/queue/cancel/<download_id>', methods=['POST'])
 def cancel_download_queue(download_id):
     """Cancel a download"""
-    success = download_queue.cancel_download(download_id)
-    if success:
+    result = download_queue.cancel_download(download_id)
+    if result == 'detached':
+        return jsonify({'message': 'Download continues for other requests', 'download_id': download_id, 'detached': True})
+    if result:
         return jsonify({'message': 'Download cancelled', 'download_id': download_id})
     else:
         return jsonify({'error': 'Download not found'}), 404
 
+@app.route('/queue/priority/<download_id>', methods=['POST'])
+def set_download_priority(download_id):
+    """Change the priority of a pending download"""
+    priority = (request.json or {}).get('priority')
+    if not isinstance(priority, int) or isinstance(priority, bool):
+        return jsonify({'error': 'Priority must be an integer'}), 400
+    
+    success = download_queue.set_priority(download_id, priority)
+    if success:
+        return jsonify({'message': 'Priority updated', 'download_id': download_id, 'priority': priority})
+    else:
+        return jsonify({'error': 'Download not found or not pending'}), 404
+
+@app.route('/queue/priority', methods=['POST'])
+def set_download_priorities():
+    """Change the priority of several pending downloads at once"""
+    priorities = (request.json or {}).get('priorities')
+    if not isinstance(priorities, dict) or not all(
+            isinstance(p, int) and not isinstance(p, bool) for p in priorities.values()):
+        return jsonify({'error': 'Expected {"priorities": {download_id: integer}}'}), 400
+    
+    updated = download_queue.set_priorities(priorities)
+    return jsonify({'message': f'Updated {len(updated)} downloads', 'updated': updated})
+
+@app.route('/queue/front/<download_id>', methods=['POST'])
+def move_download_to_front(download_id):
+    """Make a pending download the next one to start"""
+    success = download_queue.move_to_front(download_id)
+    if success:
+        return jsonify({'message': 'Download moved to front', 'download_id': download_id})
+    elif download_id in download_queue.download_history:
+        return jsonify({'error': 'Download is not pending'}), 409
+    else:
+        return jsonify({'error': 'Download not found'}), 404
+
 @app.route('/queue/history')
 def download_history():
     """Get download history from database"""
@@ -1376,7 +3260,7 @@ def redownload_from_history(download_id):
         cursor = conn.cursor()
         
         cursor.execute('''
-            SELECT url, format
+            SELECT url, format, profile
             FROM download_history
             WHERE id = ?
         ''', (download_id,))
@@ -1388,7 +3272,8 @@ def redownload_from_history(download_id):
             # Add to queue
             new_download_id = download_queue.add_to_queue({
                 'url': row['url'],
-                'format': row['format']
+                'format': row['format'],
+                'profile': row['profile']
             })
             
             return jsonify({
@@ -1403,5 +3288,14 @@ def redownload_from_history(download_id):
         app.logger.error(f"Error re-downloading: {e}")
         return jsonify({'error': 'Failed to re-download'}), 500
 
+# Requeue unfinished downloads from the last run, once every download helper
+# above is defined. The debug reloader's parent process only watches files.
+if __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+    download_queue.recover_jobs()
+
+# Start the cleanup scheduler; its first sweep runs now, after recovery, so
+# recovered jobs keep their partial files
+schedule_cleanup()
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=8080, threaded=True)
\ No newline at end of file
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Measure submit-to-start latency of the download queue.
+
+Replaces download_video with a stub that only sleeps, submits a burst of
+jobs and reports how long each one waited before a worker picked it up.
+
+Usage: python3 benchmarks/bench_dispatch.py [jobs] [max_concurrent] [job_ms]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# app.py creates downloads.db in the working directory on import
+os.chdir(tempfile.mkdtemp(prefix='vur_de_bench_'))
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import app
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def main():
+    jobs = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    max_concurrent = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    job_seconds = (int(sys.argv[3]) if len(sys.argv) > 3 else 20) / 1000
+
+    submitted = {}
+    started = {}
+    done = threading.Semaphore(0)
+
+    def fake_download_video(url, format_type, download_id, playlist_limit=None, **options):
+        started[download_id] = time.perf_counter()
+        time.sleep(job_seconds)
+        app.completed_downloads[download_id] = {'filename': url, 'filepath': '', 'size': 0}
+        done.release()
+        return app.completed_downloads[download_id]
+
+    app.download_video = fake_download_video
+    manager = app.DownloadQueueManager(max_concurrent=max_concurrent)
+
+    # Idle dispatcher: time to start a single job on an empty queue
+    t0 = time.perf_counter()
+    download_id = manager.add_to_queue({'url': 'warmup', 'format': 'audio'})
+    done.acquire()
+    idle_ms = (started[download_id] - t0) * 1000
+
+    # Burst: submit everything at once and wait for the queue to drain
+    burst_start = time.perf_counter()
+    for i in range(jobs):
+        submitted_at = time.perf_counter()
+        download_id = manager.add_to_queue({'url': f'job-{i}', 'format': 'audio'})
+        submitted[download_id] = submitted_at
+    for _ in range(jobs):
+        done.acquire()
+    burst_total = time.perf_counter() - burst_start
+
+    latencies = [(started[d] - submitted[d]) * 1000 for d in submitted]
+    ideal = -(-jobs // max_concurrent) * job_seconds
+
+    print(f"jobs={jobs} max_concurrent={max_concurrent} job_ms={job_seconds * 1000:.0f}")
+    print(f"idle submit-to-start: {idle_ms:.2f} ms")
+    print(f"burst submit-to-start: p50={percentile(latencies, 50):.2f} ms "
+          f"p95={percentile(latencies, 95):.2f} ms max={max(latencies):.2f} ms")
+    print(f"burst drained in {burst_total:.3f} s (ideal {ideal:.3f} s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Compare disk bytes written per audio track by the old and new tagging.
+
+Before: the encoded MP3 was remuxed by FFmpegMetadata, remuxed again by
+EmbedThumbnail and then re-tagged by update_id3_tags. After: the encoded
+MP3 is tagged once, cover art included, by update_id3_tags.
+
+The encode is a synthetic MP3 written in one go; each ffmpeg remux is
+modelled as what `-c copy` does on disk, a complete new file (tags plus
+audio) renamed over the old one. The mutagen saves are the real ones.
+Bytes are counted from /proc/self/io, so this runs on Linux only.
+
+Usage: python3 benchmarks/bench_tagging.py [track_minutes] [cover_kb] [tracks]
+"""
+import io
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# app.py creates downloads.db in the working directory on import
+os.chdir(tempfile.mkdtemp(prefix='vur_de_bench_'))
+
+import logging
+logging.disable(logging.CRITICAL)
+
+from mutagen.id3 import ID3, TIT2, TPE1, TALB, TSSE, APIC
+
+import app
+
+# MPEG-1 Layer III, 128 kbit/s, 44.1 kHz: 417 byte frames, 38.28 per second
+FRAME = b'\xff\xfb\x90\x00' + bytes(413)
+FRAMES_PER_SECOND = 44100 / 1152
+
+TITLE, ARTIST, ALBUM = 'Track', 'Artist', 'Album'
+
+
+def bytes_written():
+    with open('/proc/self/io') as f:
+        for line in f:
+            if line.startswith('wchar:'):
+                return int(line.split()[1])
+    raise RuntimeError('/proc/self/io has no wchar')
+
+
+def render_tags(frames):
+    """An ID3 tag with the given frames, as ffmpeg would write it in front of the audio"""
+    tags = ID3()
+    for frame in frames:
+        tags.add(frame)
+    buffer = io.BytesIO()
+    tags.save(buffer, padding=lambda info: 0)
+    return buffer.getvalue()
+
+
+def encode(path, audio):
+    """FFmpegExtractAudio: the MP3 with ffmpeg's encoder tag"""
+    with open(path, 'wb') as f:
+        f.write(render_tags([TSSE(encoding=3, text='Lavf')]))
+        f.write(audio)
+
+
+def remux(path, audio, frames):
+    """An ffmpeg -c copy pass: a complete new file replacing the old one"""
+    temp_path = path + '.temp.mp3'
+    with open(temp_path, 'wb') as f:
+        f.write(render_tags(frames))
+        f.write(audio)
+    os.replace(temp_path, path)
+
+
+def before(path, cover, audio):
+    metadata = [TSSE(encoding=3, text='Lavf'), TIT2(encoding=3, text=TITLE),
+                TPE1(encoding=3, text=ARTIST), TALB(encoding=3, text=ALBUM)]
+    encode(path, audio)
+    remux(path, audio, metadata)  # FFmpegMetadata
+    with open(cover, 'rb') as f:
+        picture = APIC(encoding=3, mime='image/jpeg', type=3, desc='Cover', data=f.read())
+    remux(path, audio, metadata + [picture])  # EmbedThumbnail
+    app.update_id3_tags(path, TITLE, ARTIST, ALBUM)
+
+
+def after(path, cover, audio):
+    encode(path, audio)
+    app.update_id3_tags(path, TITLE, ARTIST, ALBUM, cover)
+
+
+def measure(pipeline, directory, cover, audio, tracks):
+    written = []
+    for i in range(tracks):
+        path = os.path.join(directory, f'{pipeline.__name__}-{i}.mp3')
+        start = bytes_written()
+        pipeline(path, cover, audio)
+        written.append(bytes_written() - start)
+        size = os.path.getsize(path)
+        os.remove(path)
+    return sum(written) / len(written), size
+
+
+def main():
+    minutes = float(sys.argv[1]) if len(sys.argv) > 1 else 4
+    cover_kb = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    tracks = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+    directory = tempfile.mkdtemp(prefix='vur_de_tagging_')
+    cover = os.path.join(directory, 'cover.jpg')
+    with open(cover, 'wb') as f:
+        f.write(os.urandom(cover_kb * 1024))
+    audio = FRAME * int(minutes * 60 * FRAMES_PER_SECOND)
+
+    before_bytes, before_size = measure(before, directory, cover, audio, tracks)
+    after_bytes, after_size = measure(after, directory, cover, audio, tracks)
+
+    mb = 1024 * 1024
+    print(f"track_minutes={minutes:g} cover_kb={cover_kb} tracks={tracks}")
+    print(f"before: {before_bytes / mb:.2f} MiB written per track ({before_size / mb:.2f} MiB file)")
+    print(f"after:  {after_bytes / mb:.2f} MiB written per track ({after_size / mb:.2f} MiB file)")
+    print(f"after writes {after_bytes / before_bytes:.2f}x the bytes of before")
+
+
+if __name__ == '__main__':
+    main()
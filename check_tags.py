@@ -1,39 +1,233 @@
 #!/usr/bin/env python3
+"""Show the ID3 tags of an MP3, or audit whole directories of them.
+
+Usage: python3 check_tags.py <mp3_file>
+       python3 check_tags.py --batch [--format ndjson|csv] [--workers N]
+                             [--index FILE] [--missing-only] <path>...
+
+Batch mode walks the given directories for MP3s, reads them in a process
+pool and streams one record per file to stdout. With --index, files whose
+size and mtime match the last scan aren't read again: their indexed records
+count towards the report, and --missing-only lists them too. Files that
+couldn't be read stay out of the index so they are retried. A report of
+missing tags goes to stderr at the end.
+"""
+import argparse
+import csv
+import json
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
 from mutagen.mp3 import MP3
 from mutagen.id3 import ID3
 
-if len(sys.argv) < 2:
-    print("Usage: python3 check_tags.py <mp3_file>")
-    sys.exit(1)
-
-filepath = sys.argv[1]
-
-try:
-    audio = MP3(filepath, ID3=ID3)
-    print(f"File: {filepath}")
-    print(f"Duration: {audio.info.length:.2f} seconds")
-    print("\nID3 Tags:")
-    
-    tags = audio.tags
-    if tags:
-        for key, value in tags.items():
-            print(f"  {key}: {value}")
-        
-        # Print specific tags in a readable format
-        print("\nFormatted tags:")
-        if 'TIT2' in tags:
-            print(f"  Title: {tags['TIT2'].text[0]}")
-        if 'TPE1' in tags:
-            print(f"  Artist: {tags['TPE1'].text[0]}")
-        if 'TALB' in tags:
-            print(f"  Album: {tags['TALB'].text[0]}")
-        if 'TPE2' in tags:
-            print(f"  Album Artist: {tags['TPE2'].text[0]}")
-        if 'APIC:' in tags or 'APIC:Cover' in tags:
-            print("  Cover Art: Yes")
-    else:
-        print("  No ID3 tags found")
-        
-except Exception as e:
-    print(f"Error: {e}")
\ No newline at end of file
+# Frames every tagged track should have; APIC is the cover art
+REQUIRED_FRAMES = ('TIT2', 'TPE1', 'TALB', 'APIC')
+CSV_FIELDS = ('path', 'size', 'duration', 'title', 'artist', 'album', 'cover', 'missing', 'error')
+# Files per pool task, and tasks in flight per worker
+BATCH_SIZE = 64
+BATCHES_PER_WORKER = 2
+
+
+def print_tags(filepath):
+    try:
+        audio = MP3(filepath, ID3=ID3)
+        print(f"File: {filepath}")
+        print(f"Duration: {audio.info.length:.2f} seconds")
+        print("\nID3 Tags:")
+
+        tags = audio.tags
+        if tags:
+            for key, value in tags.items():
+                print(f"  {key}: {value}")
+
+            # Print specific tags in a readable format
+            print("\nFormatted tags:")
+            if 'TIT2' in tags:
+                print(f"  Title: {tags['TIT2'].text[0]}")
+            if 'TPE1' in tags:
+                print(f"  Artist: {tags['TPE1'].text[0]}")
+            if 'TALB' in tags:
+                print(f"  Album: {tags['TALB'].text[0]}")
+            if 'TPE2' in tags:
+                print(f"  Album Artist: {tags['TPE2'].text[0]}")
+            if tags.getall('APIC'):
+                print("  Cover Art: Yes")
+        else:
+            print("  No ID3 tags found")
+
+    except Exception as e:
+        print(f"Error: {e}")
+
+
+def scan_file(filepath):
+    """Tag summary of one MP3; runs in a pool worker"""
+    record = {'path': filepath, 'size': None, 'duration': None, 'title': None,
+              'artist': None, 'album': None, 'cover': False, 'missing': [], 'error': None}
+    try:
+        record['size'] = os.path.getsize(filepath)
+        audio = MP3(filepath, ID3=ID3)
+        record['duration'] = round(audio.info.length, 2)
+        tags = audio.tags
+        for frame, field in (('TIT2', 'title'), ('TPE1', 'artist'), ('TALB', 'album')):
+            if tags is not None and frame in tags and tags[frame].text:
+                record[field] = str(tags[frame].text[0])
+        record['cover'] = bool(tags is not None and tags.getall('APIC'))
+        record['missing'] = [frame for frame, present in zip(REQUIRED_FRAMES, (
+            record['title'], record['artist'], record['album'], record['cover'])) if not present]
+    except Exception as e:
+        record['error'] = str(e)
+    return record
+
+
+def scan_files(filepaths):
+    """Records of a batch of files; runs in a pool worker"""
+    return [scan_file(filepath) for filepath in filepaths]
+
+
+def walk_mp3s(paths):
+    """MP3 files under the given files and directories, in a stable order"""
+    for path in paths:
+        if os.path.isfile(path):
+            yield os.path.abspath(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith('.mp3'):
+                    yield os.path.abspath(os.path.join(root, name))
+
+
+def load_index(index_path):
+    try:
+        with open(index_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_index(index_path, index):
+    temp_path = index_path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(temp_path, index_path)
+
+
+def indexed_files(paths, index, seen):
+    """(path, indexed record) of every file found, with None as the record if it must be read
+
+    A file is read when its size or mtime differ from the index, or it couldn't
+    be read last time. Every file found is added to seen.
+    """
+    for filepath in walk_mp3s(paths):
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            continue
+        seen[filepath] = [stat.st_size, stat.st_mtime_ns]
+        entry = index.get(filepath)
+        if entry is None or entry['stat'] != seen[filepath] or entry['record']['error']:
+            yield filepath, None
+        else:
+            yield filepath, entry['record']
+
+
+def run_batch(args):
+    index = load_index(args.index) if args.index else {}
+    seen = {}  # path -> [size, mtime_ns] of every file found this run
+    results = {}  # path -> record of every file scanned this run
+    missing_counts = {frame: 0 for frame in REQUIRED_FRAMES}
+    totals = {'incomplete': 0, 'errors': 0}
+
+    if args.format == 'csv':
+        writer = csv.DictWriter(sys.stdout, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+
+    def report(record, output=True):
+        for frame in record['missing']:
+            missing_counts[frame] += 1
+        totals['incomplete'] += bool(record['missing'])
+        totals['errors'] += bool(record['error'])
+
+        if not output or (args.missing_only and not (record['missing'] or record['error'])):
+            return
+        if args.format == 'csv':
+            writer.writerow(dict(record, missing=';'.join(record['missing'])))
+        else:
+            sys.stdout.write(json.dumps(record) + '\n')
+
+    def collect(futures):
+        for future in futures:
+            for record in future.result():
+                results[record['path']] = record
+                report(record)
+
+    # Files are read in batches while the walk goes on, with a bounded number
+    # in flight, so records stream out and memory doesn't grow with the tree
+    workers = args.workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        batch = []
+        for filepath, record in indexed_files(args.paths, index, seen):
+            if record is not None:
+                # Skipped files still count; only --missing-only lists them again
+                report(record, output=args.missing_only)
+                continue
+            batch.append(filepath)
+            if len(batch) < BATCH_SIZE:
+                continue
+            if len(pending) >= workers * BATCHES_PER_WORKER:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(pool.submit(scan_files, batch))
+            batch = []
+        if batch:
+            pending.add(pool.submit(scan_files, batch))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+
+    if args.index:
+        # Files found this run replace the index entries under the scanned paths
+        roots = [os.path.abspath(path) for path in args.paths]
+        new_index = {
+            path: entry for path, entry in index.items()
+            if not any(path == root or path.startswith(root.rstrip(os.sep) + os.sep) for root in roots)
+        }
+        for path, stat in seen.items():
+            record = results.get(path) or index[path]['record']
+            # Files that couldn't be read are retried next time
+            if not record['error']:
+                new_index[path] = {'stat': stat, 'record': record}
+        save_index(args.index, new_index)
+
+    print(f"Scanned {len(results)} files, skipped {len(seen) - len(results)} unchanged", file=sys.stderr)
+    print(f"Missing tags: {totals['incomplete']} files, errors: {totals['errors']}", file=sys.stderr)
+    for frame, count in missing_counts.items():
+        print(f"  {frame}: {count}", file=sys.stderr)
+
+
+def main():
+    if len(sys.argv) == 2 and not sys.argv[1].startswith('-'):
+        print_tags(sys.argv[1])
+        return
+
+    parser = argparse.ArgumentParser(description='Audit the ID3 tags of MP3 files')
+    parser.add_argument('--batch', action='store_true', help='scan files and directories in a process pool')
+    parser.add_argument('--format', choices=('ndjson', 'csv'), default='ndjson', help='output format (default: ndjson)')
+    parser.add_argument('--workers', type=int, default=None, help='pool size (default: CPU count)')
+    parser.add_argument('--index', help='index file; files unchanged since the last scan are skipped')
+    parser.add_argument('--missing-only', action='store_true', help='only output files with missing tags or errors')
+    parser.add_argument('paths', nargs='*', help='MP3 files or directories')
+    args = parser.parse_args()
+
+    if not args.batch or not args.paths:
+        print("Usage: python3 check_tags.py <mp3_file>")
+        print("       python3 check_tags.py --batch [--format ndjson|csv] [--workers N] [--index FILE] [--missing-only] <path>...")
+        sys.exit(1)
+    run_batch(args)
+
+
+if __name__ == '__main__':
+    main()
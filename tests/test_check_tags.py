@@ -0,0 +1,59 @@
+import os
+import sys
+import tempfile
+import unittest
+from argparse import Namespace
+from contextlib import redirect_stderr, redirect_stdout
+from io import StringIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mutagen.id3 import ID3, TIT2, TPE1
+
+import check_tags
+
+# MPEG-1 Layer III, 128 kbit/s, 44.1 kHz frames
+FRAME = b'\xff\xfb\x90\x00' + bytes(413)
+
+
+class IndexTest(unittest.TestCase):
+    def run_batch(self, directory, index_path):
+        args = Namespace(paths=[directory], index=index_path, format='ndjson', workers=1, missing_only=True)
+        output, errors = StringIO(), StringIO()
+        with redirect_stdout(output), redirect_stderr(errors):
+            check_tags.run_batch(args)
+        self.summary = errors.getvalue().splitlines()[0]
+        return output.getvalue().splitlines()
+    
+    def test_unchanged_file_with_missing_tags_is_not_rescanned(self):
+        directory = tempfile.mkdtemp(prefix='vur_de_test_')
+        filepath = os.path.join(directory, 'no-album.mp3')
+        with open(filepath, 'wb') as f:
+            f.write(FRAME * 100)
+        tags = ID3()
+        tags.add(TIT2(encoding=3, text='Title'))
+        tags.add(TPE1(encoding=3, text='Artist'))
+        tags.save(filepath)
+        index_path = os.path.join(directory, 'index.json')
+        
+        self.assertEqual(len(self.run_batch(directory, index_path)), 1)
+        self.assertIn(filepath, check_tags.load_index(index_path))
+        
+        # Listed again from the index without being read
+        self.assertEqual(len(self.run_batch(directory, index_path)), 1)
+        self.assertEqual(self.summary, 'Scanned 0 files, skipped 1 unchanged')
+    
+    def test_broken_file_is_reported_every_run(self):
+        directory = tempfile.mkdtemp(prefix='vur_de_test_')
+        with open(os.path.join(directory, 'broken.mp3'), 'wb') as f:
+            f.write(b'not an mp3')
+        index_path = os.path.join(directory, 'index.json')
+        
+        self.assertEqual(len(self.run_batch(directory, index_path)), 1)
+        self.assertEqual(len(self.run_batch(directory, index_path)), 1)
+        self.assertEqual(check_tags.load_index(index_path), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
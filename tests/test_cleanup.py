@@ -0,0 +1,96 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# app.py creates downloads.db in the working directory on import
+os.chdir(tempfile.mkdtemp(prefix='vur_de_test_'))
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import app
+
+
+def old_job_dir(download_id):
+    """A job directory with a .part file, last touched two days ago"""
+    directory = app.job_dir(download_id)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'track.webm.part'), 'wb') as f:
+        f.write(b'partial')
+    past = time.time() - 2 * 86400
+    os.utime(directory, (past, past))
+    return directory
+
+
+class CleanupOldFilesTest(unittest.TestCase):
+    def tearDown(self):
+        for download_id in ('test-pending', 'test-db-paused', 'test-orphan'):
+            app.remove_job_dir(download_id)
+    
+    def test_pending_job_keeps_partial_files(self):
+        directory = old_job_dir('test-pending')
+        item = {'id': 'test-pending', 'status': 'pending'}
+        with app.download_queue.lock:
+            app.download_queue.queue.park(item)
+        try:
+            app.cleanup_old_files()
+            self.assertTrue(os.path.isdir(directory))
+        finally:
+            with app.download_queue.lock:
+                app.download_queue.queue.remove('test-pending')
+    
+    def test_unfinished_db_row_keeps_partial_files(self):
+        directory = old_job_dir('test-db-paused')
+        app.init_db()
+        conn = sqlite3.connect('downloads.db')
+        conn.execute("INSERT INTO download_history (id, url, format, status) VALUES (?, ?, ?, ?)",
+                     ('test-db-paused', 'https://example.com/v', 'audio', 'paused'))
+        conn.commit()
+        conn.close()
+        app.cleanup_old_files()
+        self.assertTrue(os.path.isdir(directory))
+    
+    def test_orphaned_job_directory_is_removed(self):
+        directory = old_job_dir('test-orphan')
+        app.cleanup_old_files()
+        self.assertFalse(os.path.isdir(directory))
+
+
+
+class CleanupStaleDownloadsTest(unittest.TestCase):
+    def quiet_download(self, download_id):
+        app.emit_progress(download_id, {'status': 'downloading'}, percent=50.0)
+        app.download_last_activity[download_id] = time.time() - 3600
+        return app.progress_bus.channel(download_id)
+    
+    def test_active_download_keeps_its_channel(self):
+        channel = self.quiet_download('test-transcoding')
+        with app.download_queue.lock:
+            app.download_queue.active_downloads['test-transcoding'] = {'id': 'test-transcoding', 'status': 'active'}
+        try:
+            app.cleanup_stale_downloads()
+            self.assertIs(app.progress_bus.channel('test-transcoding'), channel)
+            self.assertIn('test-transcoding', app.download_progress)
+        finally:
+            with app.download_queue.lock:
+                app.download_queue.active_downloads.pop('test-transcoding', None)
+            app.progress_bus.remove('test-transcoding')
+            app.download_progress.pop('test-transcoding', None)
+            app.download_last_activity.pop('test-transcoding', None)
+    
+    def test_finished_download_is_cleaned_up(self):
+        self.quiet_download('test-finished')
+        app.cleanup_stale_downloads()
+        self.assertNotIn('test-finished', app.progress_bus)
+        self.assertNotIn('test-finished', app.download_progress)
+        self.assertNotIn('test-finished', app.download_last_activity)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# app.py creates downloads.db in the working directory on import
+os.chdir(tempfile.mkdtemp(prefix='vur_de_test_'))
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import app
+
+
+class DownloadMimetypeTest(unittest.TestCase):
+    def test_profiles_get_their_container_type(self):
+        self.assertEqual(app.media_mimetype('a.mp3'), 'audio/mpeg')
+        self.assertEqual(app.media_mimetype('a.m4a'), 'audio/mp4')
+        self.assertEqual(app.media_mimetype('a.opus'), 'audio/ogg')
+        self.assertEqual(app.media_mimetype('a.mkv'), 'video/x-matroska')
+        self.assertEqual(app.media_mimetype('a.unknownext'), 'application/octet-stream')
+    
+    def test_playlist_entry_served_with_its_type(self):
+        directory = app.job_dir('test-native-playlist')
+        os.makedirs(directory, exist_ok=True)
+        filepath = os.path.join(directory, 'track.opus')
+        with open(filepath, 'wb') as f:
+            f.write(b'OggS')
+        app.completed_downloads['test-native-playlist'] = {
+            'is_playlist': True, 'format': 'audio',
+            'files': [{'filename': 'track.opus', 'filepath': filepath, 'size': 4}]
+        }
+        try:
+            response = app.app.test_client().get('/download/test-native-playlist/0')
+            self.assertEqual(response.mimetype, 'audio/ogg')
+            response.close()
+        finally:
+            app.completed_downloads.pop('test-native-playlist', None)
+            app.remove_job_dir('test-native-playlist')
+
+
+if __name__ == '__main__':
+    unittest.main()
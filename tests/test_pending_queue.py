@@ -0,0 +1,81 @@
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# app.py creates downloads.db in the working directory on import
+os.chdir(tempfile.mkdtemp(prefix='vur_de_test_'))
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import app
+
+
+def item(download_id, status='pending'):
+    return {'id': download_id, 'status': status}
+
+
+class PendingQueueTest(unittest.TestCase):
+    def test_move_to_front(self):
+        queue = app.PendingQueue()
+        queue.push(item('a'))
+        queue.push(item('b'))
+        self.assertTrue(queue.move_to_front('b'))
+        self.assertEqual(queue.pop()['id'], 'b')
+    
+    def test_move_to_front_leaves_paused_item_parked(self):
+        queue = app.PendingQueue()
+        queue.push(item('a'))
+        queue.park(item('paused', status='paused'))
+        self.assertFalse(queue.move_to_front('paused'))
+        self.assertEqual(queue.pop()['id'], 'a')
+        self.assertIsNone(queue.pop())
+        self.assertIn('paused', queue)
+    
+    def test_move_to_front_unknown(self):
+        self.assertFalse(app.PendingQueue().move_to_front('missing'))
+
+
+class MoveToFrontEndpointTest(unittest.TestCase):
+    def test_paused_download_gives_409(self):
+        paused = item('paused-job', status='paused')
+        with app.download_queue.lock:
+            app.download_queue.queue.park(paused)
+            app.download_queue.download_history['paused-job'] = paused
+        try:
+            client = app.app.test_client()
+            self.assertEqual(client.post('/queue/front/paused-job').status_code, 409)
+            self.assertEqual(client.post('/queue/front/missing-job').status_code, 404)
+            self.assertEqual(paused['status'], 'paused')
+        finally:
+            with app.download_queue.lock:
+                app.download_queue.queue.remove('paused-job')
+                app.download_queue.download_history.pop('paused-job', None)
+
+
+class PauseResumeTest(unittest.TestCase):
+    def test_resumed_job_is_dispatched_again(self):
+        app.init_db()
+        manager = app.DownloadQueueManager(max_concurrent=1)
+        manager.queue.push(item('other'))
+        job = dict(item('job', status='active'), attempt=1)
+        manager.active_downloads['job'] = job
+        manager.download_history['job'] = job
+        
+        self.assertTrue(manager.pause_download('job'))
+        manager._on_download_done(job, 1, error=app.DownloadPaused('paused'))
+        self.assertIn('job', manager.queue)
+        self.assertEqual(manager.queue.pop()['id'], 'other')
+        self.assertIsNone(manager.queue.pop())
+        
+        self.assertTrue(manager.resume_download('job'))
+        self.assertEqual(manager.queue.pop()['id'], 'job')
+        app.download_paused.pop('job', None)
+
+
+if __name__ == '__main__':
+    unittest.main()
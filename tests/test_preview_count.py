@@ -0,0 +1,105 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# app.py creates downloads.db in the working directory on import
+os.chdir(tempfile.mkdtemp(prefix='vur_de_test_'))
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import app
+
+
+class FakeYoutubeDL:
+    """Flat extraction of a playlist of `length` entries, honouring playlist_items"""
+    length = 0
+    calls = 0
+    
+    def __init__(self, options):
+        self.options = options
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        return False
+    
+    def extract_info(self, url, download=False):
+        FakeYoutubeDL.calls += 1
+        first, last = map(int, self.options['playlist_items'].split('-'))
+        entries = [{'id': str(i)} for i in range(first, min(last, self.length) + 1)]
+        return {'title': 'Playlist', 'entries': entries}
+
+
+class PlaylistCountTest(unittest.TestCase):
+    def count(self, url, length):
+        FakeYoutubeDL.length = length
+        key = app.info_cache_key(url, True)
+        job = {'done': threading.Event(), 'total': None, 'capped': False, 'error': None}
+        with mock.patch.object(app.yt_dlp, 'YoutubeDL', FakeYoutubeDL), \
+                mock.patch.object(app, 'PLAYLIST_COUNT_MAX', 20):
+            app.count_playlist(url, key, job)
+        return job, key
+    
+    def test_short_playlist_is_counted_and_cached_whole(self):
+        job, key = self.count('https://example.com/playlist?list=short', 7)
+        self.assertEqual((job['total'], job['capped']), (7, False))
+        self.assertEqual(len(app.info_cache.get(key)['entries']), 7)
+    
+    def test_long_playlist_count_is_capped(self):
+        url = 'https://example.com/playlist?list=long'
+        job, key = self.count(url, 500)
+        self.assertEqual((job['total'], job['capped']), (20, True))
+        self.assertIsNone(app.info_cache.get(key))
+        
+        calls = FakeYoutubeDL.calls
+        job, key = self.count(url, 500)
+        self.assertEqual((job['total'], job['capped']), (20, True))
+        self.assertEqual(FakeYoutubeDL.calls, calls)
+
+
+class PreviewPageTest(unittest.TestCase):
+    def test_invalid_page_gives_400(self):
+        client = app.app.test_client()
+        for page in (0, -1, 'two', 1.5, True, None):
+            app.preview_rate_limit.clear()
+            response = client.post('/preview', json={'url': 'https://example.com/playlist?list=x', 'page': page})
+            self.assertEqual(response.status_code, 400, page)
+
+    
+    def test_page_past_the_end(self):
+        url = 'https://example.com/playlist?list=fifteen'
+        entries = [{'id': str(i), 'title': f'Entry {i}'} for i in range(15)]
+        app.info_cache.put([app.info_cache_key(url, True)], {'title': 'My Playlist', 'entries': entries})
+        client = app.app.test_client()
+        
+        app.preview_rate_limit.clear()
+        response = client.post('/preview', json={'url': url, 'page': 2})
+        self.assertEqual(response.get_json()['type'], 'playlist')
+        self.assertEqual(len(response.get_json()['entries']), 5)
+        
+        app.preview_rate_limit.clear()
+        self.assertEqual(client.post('/preview', json={'url': url, 'page': 3}).status_code, 400)
+        
+        app.preview_rate_limit.clear()
+        response = client.post('/preview', json={'url': url, 'page': 2, 'playlist_limit': 10})
+        self.assertEqual(response.status_code, 400)
+    
+    def test_empty_playlist(self):
+        url = 'https://example.com/playlist?list=empty'
+        app.info_cache.put([app.info_cache_key(url, True)], {'title': 'Empty', 'entries': []})
+        app.preview_rate_limit.clear()
+        response = app.app.test_client().post('/preview', json={'url': url, 'page': 1})
+        self.assertEqual(response.get_json()['type'], 'playlist')
+        self.assertEqual(response.get_json()['entries'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# app.py creates downloads.db in the working directory on import
+os.chdir(tempfile.mkdtemp(prefix='vur_de_test_'))
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import app
+
+
+def tick(download_id, percent):
+    return {'type': 'progress', 'id': download_id, 'progress': {'percent': percent}}
+
+
+class ProgressChannelTest(unittest.TestCase):
+    def test_ticks_of_one_download_coalesce(self):
+        channel = app.ProgressChannel()
+        channel.publish(tick('a', 10))
+        channel.publish(tick('a', 20))
+        self.assertEqual([event for seq, event in channel.log], [tick('a', 20)])
+    
+    def test_ticks_of_different_downloads_are_kept(self):
+        channel = app.ProgressChannel()
+        channel.publish(tick('a', 10))
+        channel.publish(tick('b', 50))
+        channel.publish(tick('b', 60))
+        self.assertEqual([event for seq, event in channel.log], [tick('a', 10), tick('b', 60)])
+    
+    def test_resume(self):
+        channel = app.ProgressChannel()
+        first = channel.publish({'type': 'added', 'id': 'a'})
+        channel.publish({'type': 'started', 'id': 'a'})
+        subscriber = channel.resume(first)
+        self.assertEqual(subscriber.get(0)[1]['type'], 'started')
+        self.assertIsNone(channel.resume(channel.seq + 1))
+    
+    def test_resume_after_dropped_events(self):
+        channel = app.ProgressChannel()
+        for i in range(app.PROGRESS_REPLAY_SIZE + 2):
+            channel.publish({'type': 'added', 'id': str(i)})
+        self.assertIsNone(channel.resume(1))
+
+
+if __name__ == '__main__':
+    unittest.main()
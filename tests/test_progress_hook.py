@@ -0,0 +1,80 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# app.py creates downloads.db in the working directory on import
+os.chdir(tempfile.mkdtemp(prefix='vur_de_test_'))
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import app
+
+
+class ProgressHookTest(unittest.TestCase):
+    def test_counters_from_many_threads(self):
+        app.init_db()
+        download_id = 'hook-job'
+        hook = app.create_progress_hook(download_id, max_rate=1)
+        before = dict(app.progress_stats)
+        threads, calls = 8, 2000
+        
+        def run():
+            for i in range(calls):
+                hook({'status': 'downloading', 'downloaded_bytes': i, 'total_bytes': calls})
+        
+        # Switch threads often so unlocked read-modify-writes would interleave
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            workers = [threading.Thread(target=run) for _ in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        finally:
+            sys.setswitchinterval(interval)
+        
+        _, emitted, suppressed = app.progress_throttle.pop(download_id)
+        self.assertEqual(emitted + suppressed, threads * calls)
+        self.assertEqual(app.progress_stats['emitted'] - before['emitted'], emitted)
+        self.assertEqual(app.progress_stats['suppressed'] - before['suppressed'], suppressed)
+        # One tick per second at most; the test finishes well inside a few seconds
+        self.assertLessEqual(emitted, 5)
+
+
+
+class EmitProgressTest(unittest.TestCase):
+    def test_concurrent_snapshot_updates_are_kept(self):
+        download_id = 'emit-job'
+        threads, calls = 8, 300
+        
+        def run(entry):
+            for i in range(calls):
+                app.emit_progress(download_id, {'status': 'downloading'}, **{f'entry_{entry}': i})
+        
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            workers = [threading.Thread(target=run, args=(entry,)) for entry in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        finally:
+            sys.setswitchinterval(interval)
+        
+        snapshot = app.download_progress.pop(download_id)
+        app.progress_bus.remove(download_id)
+        app.download_last_activity.pop(download_id, None)
+        for entry in range(threads):
+            self.assertEqual(snapshot[f'entry_{entry}'], calls - 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# app.py creates downloads.db in the working directory on import
+os.chdir(tempfile.mkdtemp(prefix='vur_de_test_'))
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import app
+
+
+class ServedFileReleaseTest(unittest.TestCase):
+    def setUp(self):
+        self.download_id = f'test-{self.id().rsplit(".", 1)[-1]}'
+        os.makedirs(app.job_dir(self.download_id), exist_ok=True)
+        self.filepath = os.path.join(app.job_dir(self.download_id), 'track.mp3')
+        with open(self.filepath, 'wb') as f:
+            f.write(bytes(range(256)) * 4)
+        app.completed_downloads[self.download_id] = {
+            'filename': 'track.mp3', 'filepath': self.filepath, 'title': 'Track',
+            'artist': '', 'album': '', 'size': 1024, 'format': 'audio'
+        }
+        self.client = app.app.test_client()
+    
+    def tearDown(self):
+        app.completed_downloads.pop(self.download_id, None)
+        app.remove_job_dir(self.download_id)
+    
+    def fetch(self, headers=None, environ=None):
+        response = self.client.get(f'/download/{self.download_id}/0', headers=headers or {},
+                                   environ_overrides=environ or {})
+        data = response.get_data()
+        response.close()
+        return response, data
+    
+    def test_suffix_range_keeps_file(self):
+        response, data = self.fetch({'Range': 'bytes=-10'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(len(data), 10)
+        self.assertTrue(os.path.exists(self.filepath))
+    
+    def test_middle_range_keeps_file(self):
+        response, _ = self.fetch({'Range': 'bytes=100-199'})
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(os.path.exists(self.filepath))
+    
+    def test_range_covering_whole_file_releases_it(self):
+        response, data = self.fetch({'Range': 'bytes=0-'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(len(data), 1024)
+        self.assertFalse(os.path.exists(self.filepath))
+    
+    def test_full_response_releases_file(self):
+        response, data = self.fetch()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(data), 1024)
+        self.assertFalse(os.path.exists(self.filepath))
+    
+    def test_function_file_wrapper(self):
+        # uWSGI's wsgi.file_wrapper is a function, not a class
+        def file_wrapper(file, block_size=8192):
+            return FunctionWrapped(file, block_size)
+        
+        response, data = self.fetch(environ={'wsgi.file_wrapper': file_wrapper})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(data), 1024)
+        # The server sends it, so the file waits for the grace period
+        self.assertTrue(os.path.exists(self.filepath))
+        
+        response, data = self.fetch({'Range': 'bytes=0-'}, environ={'wsgi.file_wrapper': file_wrapper})
+        self.assertEqual(response.status_code, 206)
+        self.assertFalse(os.path.exists(self.filepath))
+
+
+class FunctionWrapped:
+    def __init__(self, file, block_size):
+        self.file = file
+        self.block_size = block_size
+    
+    def __iter__(self):
+        return iter(lambda: self.file.read(self.block_size), b'')
+    
+    def close(self):
+        self.file.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# app.py creates downloads.db in the working directory on import
+os.chdir(tempfile.mkdtemp(prefix='vur_de_test_'))
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import app
+
+
+class SharedDownloadTest(unittest.TestCase):
+    def setUp(self):
+        app.init_db()
+        self.manager = app.download_queue
+        self.item = {'id': 'shared-job', 'status': 'active'}
+        with self.manager.lock:
+            self.manager.active_downloads['shared-job'] = self.item
+            self.manager.download_history['shared-job'] = self.item
+            self.manager.requesters['shared-job'] = 1
+    
+    def tearDown(self):
+        with self.manager.lock:
+            self.manager.active_downloads.pop('shared-job', None)
+            self.manager.download_history.pop('shared-job', None)
+            self.manager.requesters.pop('shared-job', None)
+        app.download_cancelled.pop('shared-job', None)
+    
+    def test_cancel_detaches_until_last_requester(self):
+        client = app.app.test_client()
+        response = client.post('/queue/cancel/shared-job')
+        self.assertTrue(response.get_json()['detached'])
+        self.assertEqual(self.item['status'], 'active')
+        
+        response = client.post('/queue/cancel/shared-job')
+        self.assertNotIn('detached', response.get_json())
+        self.assertEqual(self.item['status'], 'cancelled')
+    
+    def test_legacy_cancel_detaches(self):
+        app.download_cancelled['shared-job'] = False
+        response = app.app.test_client().post('/cancel/shared-job')
+        self.assertTrue(response.get_json()['detached'])
+        self.assertFalse(app.download_cancelled['shared-job'])
+        self.assertEqual(self.item['status'], 'active')
+    
+    def test_shared_download_is_not_paused(self):
+        client = app.app.test_client()
+        self.assertEqual(client.post('/queue/pause/shared-job').status_code, 409)
+        self.assertEqual(self.item['status'], 'active')
+
+
+if __name__ == '__main__':
+    unittest.main()